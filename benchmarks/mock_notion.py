@@ -0,0 +1,352 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import uuid
+from dataclasses import dataclass, field
+from aiohttp import web
+
+IMPORTANCE_VALUES = ["Важно", "Неважно", "Срочно"]
+PROGRESS_VALUES = ["Не начато", "Начато", "Завершено"]
+CATEGORIES_VALUES = ["Прочее", "Личные проекты"]
+REMIND_VALUES = ["t08:00", "t12:30", "t15:00", "t19:45"]
+
+
+@dataclass
+class MockPage:
+    id: str
+    title: str
+    date: datetime.datetime | None
+    has_time: bool
+    importance: str
+    progress: str
+    categories: list[str]
+    remind: list[str]
+    last_edited_time: str
+    archived: bool = False
+
+    def to_json(self, database_id: str = "bench-database") -> dict:
+        date: dict | None = None
+        if self.date is not None:
+            date = {
+                "start": (
+                    self.date.isoformat()
+                    if self.has_time
+                    else self.date.strftime("%Y-%m-%d")
+                ),
+                "end": None,
+                "time_zone": None,
+            }
+        return {
+            "object": "page",
+            "id": self.id,
+            "parent": {"type": "database_id", "database_id": database_id},
+            "last_edited_time": self.last_edited_time,
+            "archived": self.archived,
+            "properties": {
+                "Title": {
+                    "id": "title",
+                    "type": "title",
+                    "title": [
+                        {
+                            "type": "text",
+                            "text": {"content": self.title},
+                            "plain_text": self.title,
+                        }
+                    ],
+                },
+                "Remind": {
+                    "id": "rmnd",
+                    "type": "multi_select",
+                    "multi_select": [{"name": name} for name in self.remind],
+                },
+                "Date": {"id": "date", "type": "date", "date": date},
+                "Importance": {
+                    "id": "impt",
+                    "type": "select",
+                    "select": {"name": self.importance},
+                },
+                "Progress": {
+                    "id": "prgs",
+                    "type": "select",
+                    "select": {"name": self.progress},
+                },
+                "Category": {
+                    "id": "ctgr",
+                    "type": "multi_select",
+                    "multi_select": [{"name": name} for name in self.categories],
+                },
+            },
+        }
+
+    def property_value(self, name: str) -> object:
+        return {
+            "Title": self.title,
+            "Remind": self.remind,
+            "Date": self.date,
+            "Importance": self.importance,
+            "Progress": self.progress,
+            "Category": self.categories,
+        }.get(name)
+
+
+def _now_iso() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+
+def _parse_date(value: str) -> datetime.datetime:
+    date = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    return date
+
+
+def generate_pages(count: int, days: int = 30, seed: int = 0) -> list[MockPage]:
+    rnd = random.Random(seed)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    pages: list[MockPage] = []
+    for i in range(count):
+        has_time = rnd.random() < 0.5
+        date = today + datetime.timedelta(days=rnd.randint(-days, days))
+        if has_time:
+            date = date.replace(hour=rnd.randint(8, 22), minute=rnd.choice([0, 30]))
+        pages.append(
+            MockPage(
+                id=str(uuid.UUID(int=rnd.getrandbits(128))),
+                title="Заметка %d" % i,
+                date=date,
+                has_time=has_time,
+                importance=rnd.choice(IMPORTANCE_VALUES),
+                progress=rnd.choice(PROGRESS_VALUES),
+                categories=rnd.sample(CATEGORIES_VALUES, rnd.randint(0, 2)),
+                remind=rnd.sample(REMIND_VALUES, rnd.randint(0, 2)),
+                last_edited_time=_now_iso(),
+            )
+        )
+    return pages
+
+
+def matches(page: MockPage, condition: dict) -> bool:
+    if "and" in condition:
+        return all(matches(page, item) for item in condition["and"])
+    if "or" in condition:
+        return any(matches(page, item) for item in condition["or"])
+    if condition.get("timestamp") == "last_edited_time":
+        (op, value), *_ = condition["last_edited_time"].items()
+        return _compare(page.last_edited_time, op, value)
+    value = page.property_value(condition.get("property", ""))
+    if "date" in condition:
+        (op, operand), *_ = condition["date"].items()
+        if op == "is_empty":
+            return value is None
+        if value is None:
+            return False
+        assert isinstance(value, datetime.datetime)
+        if op == "next_week":
+            today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+            return today <= value < today + datetime.timedelta(days=8)
+        return _compare(value, op, _parse_date(operand))
+    for key in ["select", "rich_text", "title"]:
+        if key in condition:
+            (op, operand), *_ = condition[key].items()
+            if op == "contains":
+                return operand in str(value)
+            return _compare(value, op, operand)
+    if "multi_select" in condition:
+        (op, operand), *_ = condition["multi_select"].items()
+        assert isinstance(value, list)
+        return (operand in value) == (op == "contains")
+    return True
+
+
+def _compare(value, op: str, operand) -> bool:
+    match op:
+        case "equals":
+            return value == operand
+        case "does_not_equal":
+            return value != operand
+        case "before":
+            return value < operand
+        case "after":
+            return value > operand
+        case "on_or_before":
+            return value <= operand
+        case "on_or_after":
+            return value >= operand
+    return True
+
+
+def select_property(
+    property_id: str, name: str, property_type: str, options: list[str]
+) -> dict:
+    return {
+        "id": property_id,
+        "name": name,
+        "type": property_type,
+        property_type: {"options": [{"name": option} for option in options]},
+    }
+
+
+def _sort_key(page: MockPage, name: str) -> tuple[bool, str]:
+    value = page.property_value(name)
+    return value is None, str(value)
+
+
+@dataclass
+class MockNotionServer:
+    pages: list[MockPage]
+    database_id: str = "bench-database"
+    latency: float = 0
+    error_rate: float = 0
+    retry_after: float = 0.05
+    requests: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+    _random: random.Random = field(default_factory=lambda: random.Random(1))
+    _results: dict[str, list[MockPage]] = field(default_factory=dict)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/v1/databases/{database_id}/query", self.query)
+        app.router.add_get("/v1/databases/{database_id}", self.get_database)
+        app.router.add_post("/v1/pages", self.create_page)
+        app.router.add_get("/v1/pages/{page_id}", self.get_page)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        self.requests += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.error_rate > 0 and self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {"object": "error", "status": 429, "code": "rate_limited"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        return await handler(request)
+
+    def _response(self, data: dict) -> web.Response:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    async def query(self, request: web.Request) -> web.Response:
+        body: dict = await request.json()
+        key = json.dumps(
+            {"filter": body.get("filter"), "sorts": body.get("sorts")}, sort_keys=True
+        )
+        start = int(body.get("start_cursor") or 0)
+        if start == 0 or key not in self._results:
+            found = [
+                page
+                for page in self.pages
+                if not page.archived and matches(page, body.get("filter") or {})
+            ]
+            for sort in reversed(body.get("sorts") or []):
+                found.sort(
+                    key=lambda x: _sort_key(x, sort["property"]),
+                    reverse=sort.get("direction") == "descending",
+                )
+            self._results[key] = found
+        found = self._results[key]
+        end = min(start + int(body.get("page_size", 100)), len(found))
+        has_more = end < len(found)
+        results = [page.to_json(self.database_id) for page in found[start:end]]
+        # как и Notion, отдаем только запрошенные свойства
+        property_ids = request.query.getall("filter_properties", [])
+        if property_ids:
+            for result in results:
+                result["properties"] = {
+                    name: value
+                    for name, value in result["properties"].items()
+                    if value["id"] in property_ids
+                }
+        return self._response(
+            {
+                "object": "list",
+                "results": results,
+                "has_more": has_more,
+                "next_cursor": str(end) if has_more else None,
+            }
+        )
+
+    async def get_database(self, request: web.Request) -> web.Response:
+        return self._response(
+            {
+                "object": "database",
+                "id": request.match_info["database_id"],
+                "properties": {
+                    "Title": {"id": "title", "name": "Title", "type": "title"},
+                    "Remind": select_property("rmnd", "Remind", "multi_select", []),
+                    "Date": {"id": "date", "name": "Date", "type": "date"},
+                    "Importance": select_property(
+                        "impt", "Importance", "select", IMPORTANCE_VALUES
+                    ),
+                    "Progress": select_property(
+                        "prgs", "Progress", "select", PROGRESS_VALUES
+                    ),
+                    "Category": select_property(
+                        "ctgr", "Category", "multi_select", CATEGORIES_VALUES
+                    ),
+                },
+            }
+        )
+
+    async def get_page(self, request: web.Request) -> web.Response:
+        for page in self.pages:
+            if page.id == request.match_info["page_id"]:
+                return self._response(page.to_json(self.database_id))
+        return web.json_response({"object": "error", "status": 404}, status=404)
+
+    async def create_page(self, request: web.Request) -> web.Response:
+        body: dict = await request.json()
+        properties: dict = body["properties"]
+        date = properties["Date"]["date"]
+        page = MockPage(
+            id=str(uuid.uuid4()),
+            title=properties["Title"]["title"][0]["text"]["content"],
+            date=_parse_date(date["start"]) if date is not None else None,
+            has_time="T" in (date or {}).get("start", ""),
+            importance=properties["Importance"]["select"]["name"],
+            progress=properties["Progress"]["select"]["name"],
+            categories=[x["name"] for x in properties["Category"]["multi_select"]],
+            remind=[x["name"] for x in properties["Remind"]["multi_select"]],
+            last_edited_time=_now_iso(),
+        )
+        self.pages.append(page)
+        self._results.clear()
+        return self._response(page.to_json(self.database_id))
+
+
+async def start_server(
+    server: MockNotionServer, host: str = "127.0.0.1", port: int = 0
+) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    sockets = site._server.sockets  # type: ignore
+    return runner, "http://%s:%d" % (host, sockets[0].getsockname()[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for api.notion.com")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    web.run_app(
+        MockNotionServer(
+            generate_pages(args.pages),
+            latency=args.latency,
+            error_rate=args.error_rate,
+        ).create_app(),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,241 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+import yaml
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from api.api import NotionApi  # noqa: E402
+from api.codec import JsonCodec, default_codec  # noqa: E402
+from api.query import REMINDER_PROPERTIES  # noqa: E402
+from api.structs import NotionNote  # noqa: E402
+from config import FileConfig  # noqa: E402
+from mock_notion import (  # noqa: E402
+    CATEGORIES_VALUES,
+    IMPORTANCE_VALUES,
+    PROGRESS_VALUES,
+    MockNotionServer,
+    generate_pages,
+    start_server,
+)
+
+
+@dataclass
+class BenchResult:
+    name: str
+    latencies: list[float]
+    elapsed: float
+
+    def percentile(self, value: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * value), len(ordered) - 1)]
+
+    def report(self) -> str:
+        return "%-28s %8d ops %12.1f ops/s   p50 %9.3f ms   p99 %9.3f ms" % (
+            self.name,
+            len(self.latencies),
+            len(self.latencies) / self.elapsed if self.elapsed else 0,
+            self.percentile(0.5) * 1000,
+            self.percentile(0.99) * 1000,
+        )
+
+
+async def measure_async(
+    name: str, func: Callable[[int], Awaitable[object]], iterations: int
+) -> BenchResult:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        await func(i)
+        latencies.append(time.perf_counter() - begin)
+    return BenchResult(name, latencies, time.perf_counter() - started)
+
+
+def measure_sync(
+    name: str, func: Callable[[int], object], iterations: int
+) -> BenchResult:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - begin)
+    return BenchResult(name, latencies, time.perf_counter() - started)
+
+
+def make_config(args: argparse.Namespace, database_id: str) -> FileConfig:
+    data = {
+        "token": "secret_benchmark",
+        "tg_token": "0:benchmark",
+        "db_id": database_id,
+        "tg_ids": [],
+        "importance_values": IMPORTANCE_VALUES,
+        "progress_values": PROGRESS_VALUES,
+        "categories_values": CATEGORIES_VALUES,
+        "default_remind_flags": ["t08:00"],
+        "daily_notes": [],
+        "cache_ttl": args.cache_ttl,
+        "rate_limit": args.rate_limit,
+        "rate_burst": args.rate_limit,
+        "retry_base_delay": 0.05,
+    }
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".yaml", delete=False, encoding="utf-8"
+    ) as file:
+        yaml.safe_dump(data, file, allow_unicode=True)
+    try:
+        return FileConfig(file.name)
+    finally:
+        os.remove(file.name)
+
+
+async def run_benchmarks(
+    api: NotionApi, server: MockNotionServer, args: argparse.Namespace
+) -> list[BenchResult]:
+    database_id = server.database_id
+    results: list[BenchResult] = []
+    results.append(
+        await measure_async(
+            "query_notes",
+            lambda _: api.query_notes(database_id),
+            args.iterations,
+        )
+    )
+    results.append(
+        await measure_async(
+            "get_today_notes",
+            lambda _: api.get_today_notes(database_id, True),
+            args.iterations,
+        )
+    )
+    results.append(
+        await measure_async(
+            "get_today_notes (projected)",
+            lambda _: api.get_today_notes(database_id, True, REMINDER_PROPERTIES),
+            args.iterations,
+        )
+    )
+
+    async def concurrent_today_notes(_: int):
+        await asyncio.gather(
+            *[api.get_today_notes(database_id, True) for _ in range(args.concurrency)]
+        )
+
+    results.append(
+        await measure_async(
+            "get_today_notes x%d" % args.concurrency,
+            concurrent_today_notes,
+            args.iterations,
+        )
+    )
+
+    async def create_today_notes(iteration: int):
+        await api.create_today_notes(
+            database_id,
+            [
+                {
+                    "title": "Ежедневная %d-%d" % (iteration, i),
+                    "importance": IMPORTANCE_VALUES[0],
+                    "category": [],
+                }
+                for i in range(args.daily_notes)
+            ],
+        )
+
+    results.append(
+        await measure_async(
+            "create_today_notes", create_today_notes, max(args.iterations // 10, 1)
+        )
+    )
+
+    pages = [page.to_json() for page in server.pages[: args.decode_pages]]
+    results.append(
+        measure_sync(
+            "NotionNote.from_json",
+            lambda i: NotionNote.from_json(pages[i % len(pages)]),
+            args.decode_iterations,
+        )
+    )
+    payload = JsonCodec().dumps(
+        {"object": "list", "results": pages[:100], "has_more": False}
+    )
+    codecs = {codec.name: codec for codec in [JsonCodec(), default_codec()]}
+    for codec in codecs.values():
+        results.append(
+            measure_sync(
+                "%s.loads (100 pages)" % codec.name,
+                lambda _: codec.loads(payload),
+                args.decode_iterations // 100,
+            )
+        )
+    notes = [NotionNote.from_json(page) for page in pages]
+    results.append(
+        measure_sync(
+            "NotionNote.represent",
+            lambda i: notes[i % len(notes)].represent(),
+            args.decode_iterations,
+        )
+    )
+    return results
+
+
+def run(args: argparse.Namespace, page_count: int):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = MockNotionServer(
+        generate_pages(page_count),
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+    runner, url = loop.run_until_complete(start_server(server))
+    api = NotionApi(make_config(args, server.database_id), loop, base_url=url)
+    try:
+        results = loop.run_until_complete(run_benchmarks(api, server, args))
+    finally:
+        loop.run_until_complete(api.close())
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+    print(
+        "\n== %d pages, latency %.0f ms, 429 rate %.0f%% =="
+        % (page_count, args.latency * 1000, args.error_rate * 100)
+    )
+    for result in results:
+        print(result.report())
+    print(
+        "server: %d requests, %d injected 429, %.1f MiB sent; client: %s, cache: %s"
+        % (
+            server.requests,
+            server.errors,
+            server.bytes_sent / 2**20,
+            api.stats,
+            api.cache.stats,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="NotionApi benchmarks against a local mock Notion server"
+    )
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--daily-notes", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--decode-pages", type=int, default=1000)
+    parser.add_argument("--decode-iterations", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=1000)
+    parser.add_argument("--cache-ttl", type=float, default=0)
+    args = parser.parse_args()
+    for page_count in args.pages:
+        run(args, page_count)
@@ -1,70 +1,375 @@
 from __future__ import annotations
 import datetime
-from typing import Any
+from typing import Any, AsyncIterator, Callable
 from config import FileConfig
-from api.properties import DatePageProperty, SelectPageProperty, TitlePageProperty
+from api.properties import SelectPageProperty, TitlePageProperty
 from routes.date_mapper import TodayDateMapper
 from . import API_URL
-from .structs import NotionDatabase, NotionSearchResult, NotionNote
+from .structs import (
+    NoteSchema,
+    NoteSchemaError,
+    NotionDatabase,
+    NotionSearchResult,
+    NotionNote,
+)
+from .store import NoteStore, SqliteNoteStore
+from .cache import CacheKey, QueryCache
+from .limiter import TokenBucket, backoff_delay
+from .codec import JsonCodec, default_codec
+from .query import all_of, date_range
+import re
+import time
 import aiohttp
 import asyncio
 from logger import get_logger
+from metrics import (
+    NOTION_COALESCED,
+    NOTION_REQUEST_BYTES,
+    NOTION_REQUEST_SECONDS,
+    NOTION_REQUESTS,
+    NOTION_RESPONSE_BYTES,
+    NOTION_RETRIES,
+)
 import logging
 
 logger = get_logger(__name__, logging.INFO)
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# после 5xx или таймаута Notion мог уже выполнить запрос, поэтому
+# неидемпотентные запросы повторяются только если он точно не был принят
+UNPROCESSED_RETRY_STATUSES = {429}
+UNSENT_ERRORS = (aiohttp.ClientConnectorError,)
+ENDPOINT_ID_RE = re.compile(r"^(/v1/\w+)/[^/]+")
+
+
+class NotionApiError(Exception):
+    status: int
+    data: Any
+
+    def __init__(self, status: int, data: Any):
+        super().__init__("Notion API error %d: %s" % (status, data))
+        self.status = status
+        self.data = data
+
+
+def notion_endpoint(path: str) -> str:
+    # идентификаторы страниц и баз не попадают в метки метрик
+    return ENDPOINT_ID_RE.sub(r"\1/{id}", path)
+
+
+def create_connector(config: FileConfig) -> aiohttp.TCPConnector:
+    return aiohttp.TCPConnector(
+        limit=config.http_pool_size,
+        limit_per_host=config.http_pool_per_host,
+        ttl_dns_cache=config.http_dns_cache_ttl,
+        keepalive_timeout=config.http_keepalive_timeout,
+    )
+
 
 class NotionApi:
     _token: str
     client: aiohttp.ClientSession | None = None
     version: str
+    base_url: str
     config: FileConfig
+    stores: dict[str, NoteStore]
+    schemas: dict[str, tuple[NoteSchema, float]]
+    cache: QueryCache
+    coalesced: int
+    _in_flight: dict[CacheKey, tuple[asyncio.Future[NotionSearchResult], int]]
+    limiter: TokenBucket
+    retries: int
+    retry_wait_time: float
+    change_listeners: list[Callable[[str], None]]
+    codec: JsonCodec
 
     def __init__(
         self,
         config: FileConfig,
         event_loop: asyncio.AbstractEventLoop,
         version: str = "2022-06-28",
+        base_url: str = API_URL,
+        codec: JsonCodec | None = None,
+        connector: aiohttp.BaseConnector | None = None,
     ):
         self._token = config.token
         self.config = config
         self.version = version
-        event_loop.run_until_complete(self._init_client_session())
+        self.base_url = base_url
+        self.stores = {}
+        self.schemas = {}
+        self.cache = QueryCache(config.cache_ttl, config.cache_size)
+        self.coalesced = 0
+        self._in_flight = {}
+        self.limiter = TokenBucket(config.rate_limit, config.rate_burst)
+        self.retries = 0
+        self.retry_wait_time = 0
+        self.change_listeners = []
+        self.codec = codec if codec is not None else default_codec()
+        event_loop.run_until_complete(self._init_client_session(connector))
 
-    async def _init_client_session(self):
+    async def _init_client_session(self, connector: aiohttp.BaseConnector | None):
+        connector_owner = connector is None
+        if connector is None:
+            connector = create_connector(self.config)
         self.client = aiohttp.ClientSession(
-            base_url=API_URL,
+            base_url=self.base_url,
+            connector=connector,
+            connector_owner=connector_owner,
+            timeout=aiohttp.ClientTimeout(
+                total=self.config.http_timeout_total,
+                connect=self.config.http_timeout_connect,
+                sock_read=self.config.http_timeout_read,
+            ),
             headers={
                 "Authorization": f"Bearer {self._token}",
                 "Notion-Version": self.version,
             },
         )
 
-    async def get_page(self, page_id: str) -> aiohttp.ClientResponse:
+    async def _retry_sleep(self, attempt: int, retry_after: str | None, reason: str):
+        delay = backoff_delay(attempt, self.config.retry_base_delay, retry_after)
+        logger.warning("Повтор запроса через %.1f с: %s" % (delay, reason))
+        if retry_after is not None:
+            self.limiter.pause(delay)
+        self.retries += 1
+        self.retry_wait_time += delay
+        await asyncio.sleep(delay)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json: dict | None = None,
+        params: list[tuple[str, str]] | None = None,
+        idempotent: bool = True,
+    ) -> Any:
         assert self.client is not None
-        resp = await self.client.get("/v1/pages/%s" % page_id)
-        resp.raise_for_status()
-        return resp
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_RETRY_STATUSES
+        body: bytes | None = None
+        headers: dict[str, str] = {}
+        if json is not None:
+            body = self.codec.dumps(json)
+            headers["Content-Type"] = "application/json"
+        endpoint = notion_endpoint(path)
+        labels = {"tenant": self.config.name, "endpoint": endpoint}
+        NOTION_REQUEST_BYTES.inc(len(body) if body is not None else 0, **labels)
+        started = time.monotonic()
+        status = "error"
+        attempt = 0
+        try:
+            while True:
+                await self.limiter.acquire()
+                try:
+                    async with self.client.request(
+                        method, path, data=body, headers=headers, params=params
+                    ) as resp:
+                        if (
+                            resp.status in retry_statuses
+                            and attempt < self.config.max_retries
+                        ):
+                            NOTION_RETRIES.inc(reason=str(resp.status), **labels)
+                            await self._retry_sleep(
+                                attempt,
+                                resp.headers.get("Retry-After"),
+                                "статус %d" % resp.status,
+                            )
+                            attempt += 1
+                            continue
+                        content = await resp.read()
+                        status = str(resp.status)
+                        NOTION_RESPONSE_BYTES.inc(len(content), **labels)
+                        if resp.status >= 400:
+                            try:
+                                data = self.codec.loads(content)
+                            except ValueError:
+                                data = content.decode("utf-8", "replace")
+                            raise NotionApiError(resp.status, data)
+                        return self.codec.loads(content)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= self.config.max_retries or (
+                        not idempotent and not isinstance(e, UNSENT_ERRORS)
+                    ):
+                        raise
+                    NOTION_RETRIES.inc(reason=type(e).__name__, **labels)
+                    await self._retry_sleep(attempt, None, repr(e))
+                    attempt += 1
+        finally:
+            NOTION_REQUEST_SECONDS.observe(time.monotonic() - started, **labels)
+            NOTION_REQUESTS.inc(status=status, **labels)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            "retries": self.retries,
+            "retry_wait_time": self.retry_wait_time,
+            "rate_limit_wait_time": self.limiter.wait_time,
+            "coalesced": self.coalesced,
+        }
+
+    async def get_page(self, page_id: str) -> dict:
+        return await self._request("GET", "/v1/pages/%s" % page_id)
 
     async def get_database(self, database_id: str) -> NotionDatabase:
-        assert self.client is not None
-        resp = await self.client.get("/v1/databases/%s" % database_id)
-        resp.raise_for_status()
-        data = await resp.json()
+        data = await self._request("GET", "/v1/databases/%s" % database_id)
         return NotionDatabase(data)
 
+    async def get_schema(self, database_id: str) -> NoteSchema:
+        cached = self.schemas.get(database_id)
+        if (
+            cached is not None
+            and time.monotonic() - cached[1] < self.config.schema_refresh_interval
+        ):
+            return cached[0]
+        try:
+            schema = NoteSchema.from_database(
+                await self.get_database(database_id), self.config.property_names
+            )
+        except (
+            NoteSchemaError,
+            NotionApiError,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+        ) as e:
+            logger.error("Не удалось получить схему базы %s: %s" % (database_id, e))
+            schema = (
+                cached[0]
+                if cached is not None
+                else NoteSchema(self.config.property_names)
+            )
+        self.schemas[database_id] = (schema, time.monotonic())
+        if database_id in self.stores:
+            self.stores[database_id].schema = schema
+        return schema
+
+    async def validate_schema(self, database_id: str):
+        schema = await self.get_schema(database_id)
+        daily_categories = [
+            category
+            for note_data in self.config.daily_notes
+            for category in note_data["category"]
+        ]
+        for role, values in [
+            ("importance", self.config.importance_values),
+            ("progress", self.config.progress_values),
+            ("category", self.config.categories_values + daily_categories),
+            ("remind", self.config.default_remind_flags),
+        ]:
+            unknown = schema.unknown_options(role, values)
+            if unknown:
+                logger.warning(
+                    "В свойстве %s базы нет вариантов: %s"
+                    % (getattr(schema, role), ", ".join(unknown))
+                )
+
     async def create_note(self, note: NotionNote, database_id: str) -> dict:
-        assert self.client is not None
-        resp = await self.client.post(
-            "/v1/pages",
-            json={
-                "parent": {"database_id": database_id},
-                "properties": note.get_json(),
-            },
+        try:
+            return await self._request(
+                "POST",
+                "/v1/pages",
+                json={
+                    "parent": {"database_id": database_id},
+                    "properties": note.get_json(),
+                },
+                idempotent=False,
+            )
+        finally:
+            self.notify_change(database_id)
+
+    def notify_change(self, database_id: str):
+        self.cache.invalidate(database_id)
+        for listener in self.change_listeners:
+            listener(database_id)
+
+    @staticmethod
+    def _query_payload(
+        filters: list[dict] | dict,
+        sorts: list[dict],
+        page_size: int,
+        start_cursor: str | None = None,
+    ) -> dict[str, Any]:
+        payload: dict[str, Any] = {"page_size": page_size}
+        if sorts:
+            payload["sorts"] = sorts
+        if filters != {}:
+            payload["filter"] = filters
+        if start_cursor is not None:
+            payload["start_cursor"] = start_cursor
+        return payload
+
+    async def _post_query(
+        self,
+        database_id: str,
+        filters: list[dict] | dict,
+        sorts: list[dict],
+        page_size: int,
+        start_cursor: str | None,
+        use_cache: bool,
+        properties: list[str] | None = None,
+    ) -> NotionSearchResult:
+        payload = self._query_payload(filters, sorts, page_size, start_cursor)
+        schema = await self.get_schema(database_id)
+        params: list[tuple[str, str]] | None = None
+        property_ids = schema.property_ids(properties) if properties else None
+        if property_ids is not None:
+            # Notion вернет только перечисленные свойства страниц
+            params = [("filter_properties", prop_id) for prop_id in property_ids]
+        key = QueryCache.make_key(
+            database_id, payload | {"filter_properties": property_ids}
         )
-        if resp.status != 200:
-            raise Exception(await resp.json())
-        return await resp.json()
+        if use_cache and self.cache.enabled:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        generation = self.cache.generation(database_id)
+        in_flight = self._in_flight.get(key)
+        # начатые до изменения базы запросы могут вернуть старые данные,
+        # поэтому к ним не присоединяются и их ответы не кэшируются
+        if in_flight is None or in_flight[1] != generation:
+            future = asyncio.ensure_future(
+                self._fetch_query(
+                    database_id, payload, params, sorts, filters, schema, properties
+                )
+            )
+            self._in_flight[key] = (future, generation)
+            future.add_done_callback(lambda _: self._finish_in_flight(key, future))
+        else:
+            future, generation = in_flight
+            self.coalesced += 1
+            NOTION_COALESCED.inc(tenant=self.config.name)
+        # отмена одного из ожидающих не должна прерывать общий запрос
+        result = await asyncio.shield(future)
+        if use_cache:
+            self.cache.set(key, result, generation)
+        return result
+
+    async def _fetch_query(
+        self,
+        database_id: str,
+        payload: dict[str, Any],
+        params: list[tuple[str, str]] | None,
+        sorts: list[dict],
+        filters: list[dict] | dict,
+        schema: NoteSchema,
+        properties: list[str] | None,
+    ) -> NotionSearchResult:
+        data = await self._request(
+            "POST",
+            "/v1/databases/%s/query" % database_id,
+            json=payload,
+            params=params,
+        )
+        return NotionSearchResult(data, sorts, filters, schema, properties)
+
+    def _finish_in_flight(
+        self, key: CacheKey, future: asyncio.Future[NotionSearchResult]
+    ):
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight[0] is future:
+            del self._in_flight[key]
+        # ошибка могла остаться без ожидающих, если все они были отменены
+        if not future.cancelled():
+            future.exception()
 
     async def query_notes(
         self,
@@ -72,121 +377,223 @@ class NotionApi:
         filters: list[dict] | dict = {},
         sorts: list[dict] = [],
         page_size: int = 100,
+        use_cache: bool = True,
+        properties: list[str] | None = None,
     ) -> NotionSearchResult:
-        assert self.client is not None
-        payload: dict[str, Any] = {"page_size": page_size}
-        if sorts:
-            payload["sorts"] = sorts
-        if filters != {}:
-            payload["filter"] = filters
-        resp = await self.client.post(
-            "/v1/databases/%s/query" % database_id, json=payload
+        return await self._post_query(
+            database_id, filters, sorts, page_size, None, use_cache, properties
+        )
+
+    async def iter_notes(
+        self,
+        database_id: str,
+        filters: list[dict] | dict = {},
+        sorts: list[dict] = [],
+        page_size: int = 100,
+        use_cache: bool = True,
+        properties: list[str] | None = None,
+    ) -> AsyncIterator[NotionNote]:
+        res: NotionSearchResult = await self.query_notes(
+            database_id, filters, sorts, page_size, use_cache, properties
         )
-        resp.raise_for_status()
-        return NotionSearchResult(await resp.json(), sorts)
+        while True:
+            next_page: asyncio.Future[NotionSearchResult] | None = None
+            if res.next_cursor is not None:
+                # следующая страница загружается, пока обрабатывается текущая
+                next_page = asyncio.ensure_future(
+                    self.load_next_query_page(database_id, res, page_size, use_cache)
+                )
+            try:
+                for note in res:
+                    yield note
+            except BaseException:
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+            if next_page is None:
+                return
+            res = await next_page
+
+    def get_store(self, database_id: str) -> NoteStore:
+        if database_id not in self.stores:
+            if self.config.notes_db_path is not None:
+                self.stores[database_id] = SqliteNoteStore(
+                    self.config.notes_db_path, database_id, self.codec
+                )
+            else:
+                self.stores[database_id] = NoteStore()
+            if database_id in self.schemas:
+                self.stores[database_id].schema = self.schemas[database_id][0]
+        return self.stores[database_id]
+
+    async def get_fresh_store(self, database_id: str) -> NoteStore:
+        await self.get_schema(database_id)
+        store = self.get_store(database_id)
+        if (
+            store.last_sync is None
+            or time.time() - store.last_sync >= self.config.store_max_age
+        ):
+            await self.sync_notes(database_id)
+        return store
+
+    async def sync_notes(self, database_id: str, full: bool = False) -> NoteStore:
+        await self.get_schema(database_id)
+        store = self.get_store(database_id)
+        if (
+            store.last_full_sync is None
+            or time.time() - store.last_full_sync >= self.config.full_sync_interval
+        ):
+            full = True
+        filters: dict = {}
+        if not full and store.cursor is not None:
+            # last_edited_time в Notion округляется до минуты, поэтому on_or_after
+            filters = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": store.cursor},
+            }
+        seen_ids: set[str] = set()
+        # курсор сдвигается только после всех страниц: ответ не отсортирован,
+        # и при ошибке на середине более ранние правки иначе были бы пропущены
+        last_edited_time: str | None = None
+        async for note in self.iter_notes(database_id, filters, use_cache=False):
+            assert note.id is not None
+            seen_ids.add(note.id)
+            store.upsert(note, advance_cursor=False)
+            if note.last_edited_time is not None and (
+                last_edited_time is None or note.last_edited_time > last_edited_time
+            ):
+                last_edited_time = note.last_edited_time
+        if full:
+            for note in store.notes():
+                if note.id not in seen_ids:
+                    store.remove(note.id)  # type: ignore
+        store.advance_cursor(last_edited_time)
+        store.mark_synced(full)
+        logger.info(
+            "Синхронизировано заметок: %d (%s)"
+            % (len(seen_ids), "полная" if full else "инкрементальная")
+        )
+        return store
 
     async def get_today_notes(
-        self, database_id: str, filter_finished: bool
+        self,
+        database_id: str,
+        filter_finished: bool,
+        properties: list[str] | None = None,
     ) -> list[NotionNote]:
         notes: list[NotionNote] = []
         now_date = datetime.datetime.now()
-        filters: list[dict] = [
-            DatePageProperty(
-                "Date",
-                begin_date=datetime.datetime(
-                    now_date.year, now_date.month, now_date.day
-                ),
-            ).on_or_after_filter,
-            DatePageProperty(
-                "Date",
-                begin_date=datetime.datetime(
-                    now_date.year, now_date.month, now_date.day, 23, 59
+        if self.config.incremental_sync:
+            store = await self.sync_notes(database_id)
+            return store.query(
+                datetime.datetime(now_date.year, now_date.month, now_date.day),
+                datetime.datetime(
+                    now_date.year, now_date.month, now_date.day, 23, 59, 59
                 ),
-            ).on_or_before_filter,
-        ]
+                self.config.progress_values[-1] if filter_finished else None,
+            )
+        schema = await self.get_schema(database_id)
+        filters = date_range(
+            schema.date,
+            datetime.datetime(now_date.year, now_date.month, now_date.day),
+            datetime.datetime(now_date.year, now_date.month, now_date.day, 23, 59),
+        )
         if filter_finished:
-            filters.append(
+            filters = all_of(
+                filters,
                 SelectPageProperty(
-                    "Progress", self.config.progress_values[-1]
-                ).not_equals_filter
+                    schema.progress, self.config.progress_values[-1]
+                ).not_equals_filter,
             )
-        res: NotionSearchResult = await self.query_notes(
-            database_id,
-            {"and": filters},
-        )
-        while True:
-            notes.extend([NotionNote.from_json(el) for el in res.results])
-            if res.next_cursor is None:
-                break
-            res = await self.load_next_query_page(database_id, res)
+        async for note in self.iter_notes(database_id, filters, properties=properties):
+            notes.append(note)
         return notes
 
     async def load_next_query_page(
-        self, database_id: str, results: NotionSearchResult, page_size: int = 100
+        self,
+        database_id: str,
+        results: NotionSearchResult,
+        page_size: int = 100,
+        use_cache: bool = True,
     ) -> NotionSearchResult:
         assert results.next_cursor is not None
-        assert self.client is not None
-        resp = await self.client.post(
-            "/v1/databases/%s/query" % database_id,
-            json={
-                "start_cursor": results.next_cursor,
-                "page_size": page_size,
-                "sorts": results._sorts,
-            },
+        return await self._post_query(
+            database_id,
+            results._filters,
+            results._sorts,
+            page_size,
+            results.next_cursor,
+            use_cache,
+            results._properties,
         )
-        return NotionSearchResult(await resp.json(), results._sorts)
 
     async def find_today_note_by_title(
         self, database_id: str, title: str
     ) -> NotionNote | None:
         now_date = datetime.datetime.now()
+        schema = await self.get_schema(database_id)
         search_res = await self.query_notes(
             database_id,
-            {
-                "and": [
-                    TitlePageProperty("Title", title).equals_filter,
-                    DatePageProperty(
-                        "Date",
-                        begin_date=datetime.datetime(
-                            now_date.year, now_date.month, now_date.day
-                        ),
-                    ).on_or_after_filter,
-                    DatePageProperty(
-                        "Date",
-                        begin_date=datetime.datetime(
-                            now_date.year, now_date.month, now_date.day, 23, 59
-                        ),
-                    ).on_or_before_filter,
-                ]
-            },
+            all_of(
+                TitlePageProperty(schema.title, title).equals_filter,
+                date_range(
+                    schema.date,
+                    datetime.datetime(now_date.year, now_date.month, now_date.day),
+                    datetime.datetime(
+                        now_date.year, now_date.month, now_date.day, 23, 59
+                    ),
+                ),
+            ),
         )
-        if not search_res.results:
+        if not search_res:
             return None
-        return NotionNote.from_json(search_res.results[0])
+        return search_res[0]
 
-    async def create_today_notes(self, database_id: str, notes: list[dict]):
-        for note_data in notes:
-            found_note = await self.find_today_note_by_title(
-                database_id, note_data["title"]
-            )
-            if found_note is not None:
-                logger.warn("Заметка %s уже существует" % note_data["title"])
-                continue
-            note = NotionNote()
-            note.title.text = note_data["title"]
-            note.remind.variants = self.config.default_remind_flags
-            note.date.begin_date = TodayDateMapper().get_begin_date()
-            note.date.end_date = None
-            note.importance.selected = note_data["importance"]
-            note.progress.selected = self.config.progress_values[0]
-            note.category.variants = note_data["category"]
+    async def _create_daily_note(
+        self, database_id: str, note_data: dict, semaphore: asyncio.Semaphore
+    ):
+        note = NotionNote(await self.get_schema(database_id))
+        note.title.text = note_data["title"]
+        note.remind.variants = self.config.default_remind_flags
+        note.date.begin_date = TodayDateMapper().get_begin_date()
+        note.date.end_date = None
+        note.importance.selected = note_data["importance"]
+        note.progress.selected = self.config.progress_values[0]
+        note.category.variants = note_data["category"]
+        async with semaphore:
             try:
                 await self.create_note(note, database_id)
             except Exception as e:
                 logger.error("Не удалось создать заметку: %s" % e)
+                return
+        logger.info("Создана заметка %s" % note_data["title"])
+
+    async def create_today_notes(self, database_id: str, notes: list[dict]):
+        self.cache.invalidate(database_id)
+        existing_titles: set[str] = {
+            note.title_value
+            for note in await self.get_today_notes(database_id, False, ["title"])
+        }
+        missing_notes: list[dict] = []
+        for note_data in notes:
+            if note_data["title"] in existing_titles:
+                logger.warn("Заметка %s уже существует" % note_data["title"])
                 continue
-            logger.info("Создана заметка %s" % note_data["title"])
+            existing_titles.add(note_data["title"])
+            missing_notes.append(note_data)
+        semaphore = asyncio.Semaphore(self.config.create_concurrency)
+        await asyncio.gather(
+            *[
+                self._create_daily_note(database_id, note_data, semaphore)
+                for note_data in missing_notes
+            ]
+        )
+        self.cache.invalidate(database_id)
 
-    def __del__(self):
+    async def close(self):
+        for future, _ in self._in_flight.values():
+            future.cancel()
+        self._in_flight = {}
         if self.client is not None:
-            asyncio.run(self.client.close())
+            await self.client.close()
+            self.client = None
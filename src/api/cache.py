@@ -0,0 +1,85 @@
+from __future__ import annotations
+from collections import OrderedDict
+import json
+import time
+from typing import Any
+from .structs import NotionSearchResult
+
+CacheKey = tuple[str, str]
+
+
+class QueryCache:
+    ttl: float
+    max_size: int
+    hits: int
+    misses: int
+    _epoch: int
+    _generations: dict[str, int]
+    _entries: OrderedDict[CacheKey, tuple[float, NotionSearchResult]]
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._epoch = 0
+        self._generations = {}
+        self._entries = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    @staticmethod
+    def make_key(database_id: str, payload: dict[str, Any]) -> CacheKey:
+        return (
+            database_id,
+            json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str),
+        )
+
+    def get(self, key: CacheKey) -> NotionSearchResult | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, database_id: str) -> int:
+        # растет при каждой инвалидации базы, в том числе общей
+        return self._epoch + self._generations.get(database_id, 0)
+
+    def set(
+        self,
+        key: CacheKey,
+        value: NotionSearchResult,
+        generation: int | None = None,
+    ):
+        if not self.enabled:
+            return
+        # ответ на запрос, начатый до инвалидации, мог устареть
+        if generation is not None and generation != self.generation(key[0]):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, database_id: str | None = None):
+        if database_id is None:
+            self._epoch += 1
+            self._entries.clear()
+            return
+        self._generations[database_id] = self._generations.get(database_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == database_id]:
+            del self._entries[key]
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JsonCodec:
+    name: str = "json"
+
+    def loads(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+    name: str = "orjson"
+
+    def loads(self, data: bytes | str) -> Any:
+        return orjson.loads(data)  # type: ignore
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=str)  # type: ignore
+
+
+def default_codec() -> JsonCodec:
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    rate: float
+    capacity: float
+    wait_time: float
+    waits: int
+    _tokens: float
+    _updated: float
+    _blocked_until: float
+    _lock: asyncio.Lock | None
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        assert rate > 0
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.wait_time = 0
+        self.waits = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = None
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        # лок создается лениво, чтобы привязаться к работающему циклу событий
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._blocked_until - now
+                if delay <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                delay = max(delay, (1 - self._tokens) / self.rate)
+                await asyncio.sleep(delay)
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                self.wait_time += waited
+                self.waits += 1
+
+    def pause(self, delay: float):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {"wait_time": self.wait_time, "waits": self.waits}
+
+
+def backoff_delay(
+    attempt: int, base: float, retry_after: str | None = None, limit: float = 60
+) -> float:
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+    delay = min(base * 2**attempt, limit)
+    return delay / 2 + random.uniform(0, delay / 2)
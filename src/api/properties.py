@@ -1,11 +1,17 @@
 from abc import ABC, abstractmethod
 import datetime
+import sys
 import pytz
 from dataclasses import dataclass
 
 
+def intern_names(options: list[dict]) -> list[str]:
+    return [sys.intern(option["name"]) for option in options]
+
+
 class AbstractPageProperty(ABC):
-    property_name: str = ""
+    __slots__ = ("property_name",)
+    property_name: str
 
     @abstractmethod
     def get_json(self) -> dict:
@@ -21,6 +27,7 @@ class AbstractPageProperty(ABC):
 
 
 class TitlePageProperty(AbstractPageProperty):
+    __slots__ = ("_text",)
     _text: str
 
     def __init__(self, name: str, text: str | None = None):
@@ -53,6 +60,7 @@ class TitlePageProperty(AbstractPageProperty):
 
 
 class CheckboxPageProperty(AbstractPageProperty):
+    __slots__ = ("_checked",)
     _checked: bool
 
     def __init__(self, name: str, value: bool | None = None):
@@ -85,6 +93,7 @@ class CheckboxPageProperty(AbstractPageProperty):
 
 
 class SelectPageProperty(AbstractPageProperty):
+    __slots__ = ("_selected",)
     _selected: str
 
     def __init__(self, name: str, value: str | None = None):
@@ -117,6 +126,7 @@ class SelectPageProperty(AbstractPageProperty):
 
 
 class MultiSelectPageProperty(AbstractPageProperty):
+    __slots__ = ("_selected",)
     _selected: list[str]
 
     def __init__(self, name: str, variants: list[str] = []):
@@ -160,9 +170,10 @@ class DatePropertyDelta:
 
 
 class DatePageProperty(AbstractPageProperty):
-    _timezone: str | None = None
+    __slots__ = ("_timezone", "_begin_date", "_end_date")
+    _timezone: str | None
     _begin_date: datetime.datetime
-    _end_date: datetime.datetime | None = None
+    _end_date: datetime.datetime | None
 
     def __init__(
         self,
@@ -172,12 +183,10 @@ class DatePageProperty(AbstractPageProperty):
         end_date: datetime.datetime | None = None,
     ):
         self.property_name = name
-        if timezone is not None:
-            self._timezone = timezone
+        self._timezone = timezone
+        self._end_date = end_date
         if begin_date is not None:
             self._begin_date = begin_date
-        if end_date is not None:
-            self._end_date = end_date
 
     @property
     def timezone(self) -> str | None:
@@ -192,6 +201,10 @@ class DatePageProperty(AbstractPageProperty):
     def timezone(self, value: str | None):
         self._timezone = value
 
+    @property
+    def is_set(self) -> bool:
+        return hasattr(self, "_begin_date")
+
     @property
     def begin_date(self) -> datetime.datetime:
         return self._begin_date
@@ -210,11 +223,14 @@ class DatePageProperty(AbstractPageProperty):
 
     @staticmethod
     def stringify_date(date: datetime.datetime) -> str:
-        if date.minute != 0 or date.hour != 0:
+        # у даты со смещением полночь - это время, а не день целиком
+        if date.minute != 0 or date.hour != 0 or date.tzinfo is not None:
             return date.isoformat()
         return date.strftime("%Y-%m-%d")
 
     def get_json(self) -> dict:
+        if not self.is_set:
+            return {self.property_name: {"date": None}}
         data = {"start": DatePageProperty.stringify_date(self._begin_date)}
         if self._end_date is not None:
             data["end"] = DatePageProperty.stringify_date(self._end_date)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+import datetime
+from .properties import DatePageProperty
+
+LOWER_BOUNDS = {"after": True, "on_or_after": False}
+UPPER_BOUNDS = {"before": True, "on_or_before": False}
+
+# свойства, нужные для вывода заметок через represent()
+DISPLAY_PROPERTIES = ["title", "date", "importance"]
+REMINDER_PROPERTIES = DISPLAY_PROPERTIES + ["remind"]
+
+
+def _date_bound(condition: dict) -> tuple[str, str, str] | None:
+    date: dict | None = condition.get("date")
+    if "property" not in condition or date is None or len(date) != 1:
+        return None
+    ((key, value),) = date.items()
+    if key not in LOWER_BOUNDS and key not in UPPER_BOUNDS:
+        return None
+    return condition["property"], key, value
+
+
+def _bound_sort_key(condition: dict) -> tuple[datetime.datetime, bool]:
+    _, key, value = _date_bound(condition)  # type: ignore
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.astimezone()
+    # при равных датах строгая граница уже нестрогой
+    if key in LOWER_BOUNDS:
+        return date, LOWER_BOUNDS[key]
+    return date, not UPPER_BOUNDS[key]
+
+
+def _merge_bounds(conditions: list[dict]) -> list[dict]:
+    lower: dict[str, dict] = {}
+    upper: dict[str, dict] = {}
+    merged: list[dict] = []
+    for condition in conditions:
+        bound = _date_bound(condition)
+        if bound is None:
+            merged.append(condition)
+            continue
+        name, key, _ = bound
+        bounds, pick = (lower, max) if key in LOWER_BOUNDS else (upper, min)
+        if name not in bounds:
+            bounds[name] = condition
+            merged.append(condition)
+        elif pick(condition, bounds[name], key=_bound_sort_key) is condition:
+            merged[merged.index(bounds[name])] = condition
+            bounds[name] = condition
+    return merged
+
+
+def _flatten(operator: str, conditions: tuple[dict, ...]) -> list[dict]:
+    flat: list[dict] = []
+    for condition in conditions:
+        if not condition:
+            continue
+        if operator in condition and len(condition) == 1:
+            nested = _flatten(operator, tuple(condition[operator]))
+        else:
+            nested = [condition]
+        flat.extend(item for item in nested if item not in flat)
+    return flat
+
+
+def all_of(*conditions: dict) -> dict:
+    # вложенные and раскрываются, лишние границы дат отбрасываются
+    flat = _merge_bounds(_flatten("and", conditions))
+    if not flat:
+        return {}
+    if len(flat) == 1:
+        return flat[0]
+    return {"and": flat}
+
+
+def any_of(*conditions: dict) -> dict:
+    flat = _flatten("or", conditions)
+    if not flat:
+        return {}
+    if len(flat) == 1:
+        return flat[0]
+    return {"or": flat}
+
+
+def date_range(
+    name: str,
+    begin: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    timezone: str | None = None,
+) -> dict:
+    conditions: list[dict] = []
+    if begin is not None:
+        conditions.append(DatePageProperty(name, timezone, begin).on_or_after_filter)
+    if end is not None:
+        conditions.append(DatePageProperty(name, timezone, end).on_or_before_filter)
+    return all_of(*conditions)
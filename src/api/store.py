@@ -0,0 +1,236 @@
+from __future__ import annotations
+import datetime
+import sqlite3
+import time
+from .structs import DEFAULT_SCHEMA, NoteSchema, NotionNote
+from .codec import JsonCodec, default_codec
+
+SQLITE_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# 1 - begin_date хранится в UTC
+SQLITE_STORE_VERSION = 1
+
+
+def to_local_date(date: datetime.datetime) -> datetime.datetime:
+    if date.tzinfo is None:
+        return date
+    return date.astimezone().replace(tzinfo=None)
+
+
+def to_sqlite_date(date: datetime.datetime) -> str:
+    # даты без смещения считаются локальными, как и границы запросов
+    return date.astimezone(datetime.timezone.utc).strftime(SQLITE_DATE_FORMAT)
+
+
+class NoteStore:
+    _notes: dict[str, NotionNote]
+    schema: NoteSchema = DEFAULT_SCHEMA
+    cursor: str | None
+    last_sync: float | None
+    last_full_sync: float | None
+
+    def __init__(self):
+        self._notes = {}
+        self.cursor = None
+        self.last_sync = None
+        self.last_full_sync = None
+
+    def upsert(self, note: NotionNote, advance_cursor: bool = True):
+        assert note.id is not None
+        if note.archived:
+            self.remove(note.id)
+        else:
+            self._notes[note.id] = note
+        if advance_cursor:
+            self.advance_cursor(note.last_edited_time)
+
+    def remove(self, note_id: str):
+        self._notes.pop(note_id, None)
+
+    def clear(self):
+        self._notes = {}
+        self.cursor = None
+
+    def advance_cursor(self, last_edited_time: str | None):
+        # ISO-строки Notion в UTC сравниваются лексикографически
+        if last_edited_time is not None and (
+            self.cursor is None or last_edited_time > self.cursor
+        ):
+            self.cursor = last_edited_time
+
+    def commit(self):
+        pass
+
+    def mark_synced(self, full: bool):
+        self.last_sync = time.time()
+        if full:
+            self.last_full_sync = self.last_sync
+
+    def get(self, note_id: str) -> NotionNote | None:
+        return self._notes.get(note_id)
+
+    def notes(self) -> list[NotionNote]:
+        return list(self._notes.values())
+
+    def query(
+        self,
+        begin_date: datetime.datetime,
+        end_date: datetime.datetime,
+        exclude_progress: str | None = None,
+    ) -> list[NotionNote]:
+        found: list[NotionNote] = []
+        for note in self._notes.values():
+            if not note.date.is_set:
+                continue
+            date = to_local_date(note.begin_date_value)
+            if date < begin_date or date > end_date:
+                continue
+            if exclude_progress is not None and note.progress_value == exclude_progress:
+                continue
+            found.append(note)
+        found.sort(key=lambda x: to_local_date(x.begin_date_value))
+        return found
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+
+class SqliteNoteStore(NoteStore):
+    _connection: sqlite3.Connection
+    database_id: str
+    codec: JsonCodec
+
+    def __init__(self, path: str, database_id: str, codec: JsonCodec | None = None):
+        self.database_id = database_id
+        self.codec = codec if codec is not None else default_codec()
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS notes (
+                id TEXT PRIMARY KEY,
+                database_id TEXT NOT NULL,
+                begin_date TEXT,
+                progress TEXT,
+                importance TEXT,
+                last_edited_time TEXT,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS notes_date_idx ON notes (database_id, begin_date);
+            CREATE INDEX IF NOT EXISTS notes_progress_idx ON notes (database_id, progress);
+            CREATE INDEX IF NOT EXISTS notes_importance_idx
+                ON notes (database_id, importance);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                database_id TEXT PRIMARY KEY,
+                cursor TEXT,
+                last_sync REAL,
+                last_full_sync REAL
+            );
+            """)
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < SQLITE_STORE_VERSION:
+            # старые даты без смещения не пересчитать, хранилище заполнится
+            # заново при полной синхронизации
+            self._connection.executescript("""
+                DELETE FROM notes;
+                DELETE FROM sync_state;
+                PRAGMA user_version = %d;
+                """ % SQLITE_STORE_VERSION)
+        row = self._connection.execute(
+            "SELECT cursor, last_sync, last_full_sync FROM sync_state "
+            "WHERE database_id = ?",
+            (database_id,),
+        ).fetchone()
+        self.cursor, self.last_sync, self.last_full_sync = row or (None, None, None)
+
+    def upsert(self, note: NotionNote, advance_cursor: bool = True):
+        assert note.id is not None
+        if advance_cursor:
+            self.advance_cursor(note.last_edited_time)
+        if note.archived:
+            self.remove(note.id)
+            return
+        begin_date: str | None = None
+        if note.date.is_set:
+            begin_date = to_sqlite_date(note.begin_date_value)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                note.id,
+                self.database_id,
+                begin_date,
+                note.progress_value,
+                note.importance_value,
+                note.last_edited_time,
+                self.codec.dumps(note.get_page_json()),
+            ),
+        )
+
+    def remove(self, note_id: str):
+        self._connection.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+
+    def clear(self):
+        self._connection.execute(
+            "DELETE FROM notes WHERE database_id = ?", (self.database_id,)
+        )
+        self.cursor = None
+        self._save_state()
+
+    def commit(self):
+        self._connection.commit()
+
+    def mark_synced(self, full: bool):
+        super().mark_synced(full)
+        self._save_state()
+
+    def _save_state(self):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+            (self.database_id, self.cursor, self.last_sync, self.last_full_sync),
+        )
+        self._connection.commit()
+
+    def get(self, note_id: str) -> NotionNote | None:
+        row = self._connection.execute(
+            "SELECT data FROM notes WHERE id = ?", (note_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return NotionNote.from_json(self.codec.loads(row[0]), self.schema)
+
+    def notes(self) -> list[NotionNote]:
+        return [
+            NotionNote.from_json(self.codec.loads(row[0]), self.schema)
+            for row in self._connection.execute(
+                "SELECT data FROM notes WHERE database_id = ?", (self.database_id,)
+            )
+        ]
+
+    def query(
+        self,
+        begin_date: datetime.datetime,
+        end_date: datetime.datetime,
+        exclude_progress: str | None = None,
+    ) -> list[NotionNote]:
+        sql = (
+            "SELECT data FROM notes WHERE database_id = ? "
+            "AND begin_date BETWEEN ? AND ?"
+        )
+        params: list = [
+            self.database_id,
+            to_sqlite_date(begin_date),
+            to_sqlite_date(end_date),
+        ]
+        if exclude_progress is not None:
+            sql += " AND progress != ?"
+            params.append(exclude_progress)
+        sql += " ORDER BY begin_date"
+        return [
+            NotionNote.from_json(self.codec.loads(row[0]), self.schema)
+            for row in self._connection.execute(sql, params)
+        ]
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM notes WHERE database_id = ?", (self.database_id,)
+        ).fetchone()[0]
+
+    def close(self):
+        self._connection.close()
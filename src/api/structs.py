@@ -1,13 +1,15 @@
 from __future__ import annotations
 import enum
-from typing import Any
+from typing import Any, Iterator, Sequence, overload
 import datetime
+import sys
 from .properties import (
     CheckboxPageProperty,
     DatePageProperty,
     SelectPageProperty,
     MultiSelectPageProperty,
     TitlePageProperty,
+    intern_names,
 )
 
 
@@ -48,11 +50,16 @@ class NotionDatabaseProperty:
     id: str
     name: str
     type: NotionDatabasePropertyEnum | Any
+    options: list[str]
 
     def __init__(self, data: dict):
         self.id = data["id"]
         self.name = data["name"]
         self.type = NotionDatabasePropertyEnum.from_string(data["type"])
+        self.options = [
+            option["name"]
+            for option in (data.get(data["type"]) or {}).get("options", [])
+        ]
 
     def __repr__(self) -> str:
         return "<DbProperty: %s %s>" % (self.name, self.type.name)
@@ -76,21 +83,174 @@ class NotionDatabase:
         return "<Db: %s>" % ", ".join([data.__repr__() for data in self.properties])
 
 
-class NotionSearchResult:
+class NoteSchemaError(Exception):
+    pass
+
+
+class NoteSchema:
+    __slots__ = (
+        "title",
+        "remind",
+        "date",
+        "importance",
+        "progress",
+        "category",
+        "options",
+        "ids",
+    )
+    title: str
+    remind: str
+    date: str
+    importance: str
+    progress: str
+    category: str
+    options: dict[str, list[str]]
+    ids: dict[str, str]
+
+    ROLE_TYPES = {
+        "title": NotionDatabasePropertyEnum.TITLE,
+        "remind": NotionDatabasePropertyEnum.MULTI_SELECT,
+        "date": NotionDatabasePropertyEnum.DATE,
+        "importance": NotionDatabasePropertyEnum.SELECT,
+        "progress": NotionDatabasePropertyEnum.SELECT,
+        "category": NotionDatabasePropertyEnum.MULTI_SELECT,
+    }
+    DEFAULT_NAMES = {
+        "title": "Title",
+        "remind": "Remind",
+        "date": "Date",
+        "importance": "Importance",
+        "progress": "Progress",
+        "category": "Category",
+    }
+
+    def __init__(
+        self,
+        names: dict[str, str] = {},
+        options: dict[str, list[str]] = {},
+        ids: dict[str, str] = {},
+    ):
+        for role, name in (NoteSchema.DEFAULT_NAMES | names).items():
+            setattr(self, role, sys.intern(name))
+        self.options = options
+        self.ids = ids
+
+    @staticmethod
+    def from_database(database: NotionDatabase, names: dict[str, str]) -> NoteSchema:
+        properties = {prop.name: prop for prop in database.properties}
+        resolved: dict[str, str] = {}
+        options: dict[str, list[str]] = {}
+        ids: dict[str, str] = {}
+        for role, prop_type in NoteSchema.ROLE_TYPES.items():
+            name = names.get(role, NoteSchema.DEFAULT_NAMES[role])
+            if name not in properties and role == "title":
+                # заголовок в базе всегда один, его имя можно не указывать
+                name = next(
+                    prop.name
+                    for prop in properties.values()
+                    if prop.type == NotionDatabasePropertyEnum.TITLE
+                )
+            if name not in properties:
+                raise NoteSchemaError("В базе нет свойства %s (%s)" % (name, role))
+            if properties[name].type != prop_type:
+                raise NoteSchemaError(
+                    "Свойство %s должно иметь тип %s, а не %s"
+                    % (name, prop_type.name, properties[name].type.name)
+                )
+            resolved[role] = name
+            options[role] = properties[name].options
+            ids[role] = properties[name].id
+        return NoteSchema(resolved, options, ids)
+
+    def property_ids(self, roles: list[str]) -> list[str] | None:
+        # без загруженной схемы запрашиваются все свойства
+        if any(role not in self.ids for role in roles):
+            return None
+        return [self.ids[role] for role in roles]
+
+    def unknown_options(self, role: str, values: list[str]) -> list[str]:
+        if role not in self.options:
+            return []
+        return [value for value in values if value not in self.options[role]]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, NoteSchema) and all(
+            getattr(self, role) == getattr(other, role)
+            for role in NoteSchema.DEFAULT_NAMES
+        )
+
+
+DEFAULT_SCHEMA = NoteSchema()
+
+
+class NotionSearchResult(Sequence["NotionNote"]):
     _sorts: list[dict]
-    results: list[dict]
+    _filters: list[dict] | dict
+    _items: list[dict | NotionNote]
+    _schema: NoteSchema
+    _properties: list[str] | None
     has_more: bool
     next_cursor: str | None = None
 
-    def __init__(self, data: dict, sorts: list[dict]):
+    def __init__(
+        self,
+        data: dict,
+        sorts: list[dict],
+        filters: list[dict] | dict = {},
+        schema: NoteSchema = DEFAULT_SCHEMA,
+        properties: list[str] | None = None,
+    ):
         self._sorts = sorts
-        self.results = data["results"]
+        self._filters = filters
+        self._schema = schema
+        self._properties = properties
+        self._items = data["results"]
         self.has_more = data["has_more"]
         if self.has_more:
             self.next_cursor = data["next_cursor"]
 
+    def _decode(self, index: int) -> NotionNote:
+        item = self._items[index]
+        if isinstance(item, dict):
+            # исходный словарь страницы больше не нужен после разбора
+            item = NotionNote.from_json(item, self._schema)
+            self._items[index] = item
+        return item
+
+    @overload
+    def __getitem__(self, index: int) -> NotionNote: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[NotionNote]: ...
+
+    def __getitem__(self, index: int | slice) -> NotionNote | list[NotionNote]:
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self._items)))]
+        return self._decode(index)
+
+    def __iter__(self) -> Iterator[NotionNote]:
+        for index in range(len(self._items)):
+            yield self._decode(index)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
 
 class NotionNote:
+    __slots__ = (
+        "id",
+        "last_edited_time",
+        "archived",
+        "title",
+        "remind",
+        "date",
+        "importance",
+        "progress",
+        "category",
+    )
+    id: str | None
+    last_edited_time: str | None
+    archived: bool
     title: TitlePageProperty
     remind: MultiSelectPageProperty
     date: DatePageProperty
@@ -98,37 +258,59 @@ class NotionNote:
     progress: SelectPageProperty
     category: MultiSelectPageProperty
 
-    def __init__(self):
-        self.title = TitlePageProperty("Title")
-        self.remind = MultiSelectPageProperty("Remind")
-        self.date = DatePageProperty("Date", "Europe/Moscow")
-        self.importance = SelectPageProperty("Importance")
-        self.progress = SelectPageProperty("Progress")
-        self.category = MultiSelectPageProperty("Category")
+    def __init__(self, schema: NoteSchema = DEFAULT_SCHEMA):
+        self.id = None
+        self.last_edited_time = None
+        self.archived = False
+        self.title = TitlePageProperty(schema.title)
+        self.remind = MultiSelectPageProperty(schema.remind)
+        self.date = DatePageProperty(schema.date, "Europe/Moscow")
+        self.importance = SelectPageProperty(schema.importance)
+        self.progress = SelectPageProperty(schema.progress)
+        self.category = MultiSelectPageProperty(schema.category)
 
     @staticmethod
-    def from_json(page: dict) -> NotionNote:
+    def from_json(page: dict, schema: NoteSchema = DEFAULT_SCHEMA) -> NotionNote:
         properties: dict = page["properties"]
-        obj = NotionNote()
-        obj.remind.variants = list(
-            map(lambda x: x["name"], properties["Remind"]["multi_select"])
+        obj = NotionNote(schema)
+        obj.id = page.get("id")
+        obj.last_edited_time = page.get("last_edited_time")
+        obj.archived = page.get("archived", False)
+        # при запросе с filter_properties части свойств в ответе нет
+        title: dict | None = properties.get(schema.title)
+        obj.title.text = (
+            title["title"][0]["text"]["content"]
+            if title is not None and title["title"]
+            else ""
         )
-        obj.title.text = properties["Title"]["title"][0]["text"]["content"]
-        obj.importance.selected = properties["Importance"]["select"]["name"]
-        obj.progress.selected = properties["Progress"]["select"]["name"]
-        obj.category.variants = list(
-            map(lambda x: x["name"], properties["Category"]["multi_select"])
+        remind: dict | None = properties.get(schema.remind)
+        if remind is not None:
+            obj.remind.variants = intern_names(remind["multi_select"])
+        category: dict | None = properties.get(schema.category)
+        if category is not None:
+            obj.category.variants = intern_names(category["multi_select"])
+        importance: dict | None = properties.get(schema.importance)
+        obj.importance.selected = (
+            sys.intern(importance["select"]["name"])
+            if importance is not None and importance["select"] is not None
+            else ""
         )
-        for attr, key in {
-            "begin_date": "start",
-            "end_date": "end",
-            "timezone": "time_zone",
-        }.items():
-            value: str | None = properties["Date"]["date"][key]
-            if "date" in attr and value is not None:
-                setattr(obj.date, attr, datetime.datetime.fromisoformat(value))
-                continue
-            setattr(obj.date, attr, value)
+        progress: dict | None = properties.get(schema.progress)
+        obj.progress.selected = (
+            sys.intern(progress["select"]["name"])
+            if progress is not None and progress["select"] is not None
+            else ""
+        )
+        date_property: dict | None = properties.get(schema.date)
+        date: dict | None = date_property["date"] if date_property is not None else None
+        if date is None:
+            return obj
+        obj.date.begin_date = datetime.datetime.fromisoformat(date["start"])
+        end: str | None = date.get("end")
+        obj.date.end_date = (
+            datetime.datetime.fromisoformat(end) if end is not None else None
+        )
+        obj.date.timezone = date.get("time_zone")
         return obj
 
     def represent(self) -> str:
@@ -212,3 +394,11 @@ class NotionNote:
         ]:
             data.update(i.get_json())
         return data
+
+    def get_page_json(self) -> dict:
+        return {
+            "id": self.id,
+            "last_edited_time": self.last_edited_time,
+            "archived": self.archived,
+            "properties": self.get_json(),
+        }
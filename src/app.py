@@ -0,0 +1,73 @@
+from config import get_config
+import asyncio
+from aiogram import Bot
+from logger import get_logger
+from main import (
+    create_dispatcher,
+    run_bot,
+    run_tasks,
+    run_until_stopped,
+    setup_telegram_webhook,
+)
+from metrics import setup_metrics
+from scheduler import create_outbox, create_schedulers, run_shard
+from shards import ShardSupervisor
+from tenants import Tenants
+from aiohttp import web
+from web import run_web_app
+from webhooks import setup_notion_webhook
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+CONFIG = get_config()
+
+
+async def main(tenants: Tenants):
+    bot = Bot(CONFIG.tg_token)
+    dp = create_dispatcher(tenants)
+    if CONFIG.scheduler_shards > 1:
+        CONFIG.validate_shards()
+        supervisor = ShardSupervisor(run_shard, CONFIG.scheduler_shards)
+        for tenant in tenants:
+            tenant.api.change_listeners.append(
+                lambda _, name=tenant.name: supervisor.notify_change(name)
+            )
+        tasks = [supervisor.run()]
+    else:
+        outbox = create_outbox(bot)
+        tasks = [outbox.run()]
+        tasks += [scheduler.run() for scheduler in create_schedulers(tenants, outbox)]
+    app = web.Application()
+    if CONFIG.tg_webhook_url is not None:
+        setup_telegram_webhook(app, dp, bot)
+    else:
+        tasks.append(run_bot(dp, bot))
+    for tenant in tenants:
+        if tenant.config.notion_webhook_path is None:
+            continue
+        path = tenant.config.notion_webhook_path
+        if len(tenants) > 1:
+            path = path.rstrip("/") + "/" + tenant.name
+        setup_notion_webhook(
+            app,
+            tenant.api,
+            path,
+            tenant.config.db_id,
+            tenant.config.notion_webhook_token,
+        )
+    if CONFIG.metrics_path is not None:
+        setup_metrics(app, CONFIG.metrics_path)
+    if app.router.routes():
+        tasks.append(run_web_app(app, CONFIG.web_host, CONFIG.web_port))
+    await run_tasks(tasks)
+
+
+if __name__ == "__main__":
+    logger.info("Бот и планировщик запущены в одном процессе!")
+    loop = asyncio.new_event_loop()
+    tenants = Tenants(CONFIG, loop)
+    asyncio.set_event_loop(loop)
+    try:
+        run_until_stopped(loop, main(tenants))
+    finally:
+        loop.run_until_complete(tenants.close())
@@ -1,5 +1,7 @@
+import copy
 import yaml
 import os
+from functools import lru_cache
 
 
 class FileConfig:
@@ -14,6 +16,52 @@ class FileConfig:
     default_remind_flags: list[str]
     daily_notes: list[dict]
     tg_ids: list[int]
+    sync_interval: int = 300
+    incremental_sync: bool = False
+    full_sync_interval: int = 3600
+    notes_db_path: str | None = None
+    store_max_age: int = 60
+    cache_ttl: float = 30
+    cache_size: int = 128
+    create_concurrency: int = 3
+    rate_limit: float = 3
+    rate_burst: int = 3
+    max_retries: int = 5
+    retry_base_delay: float = 1
+    http_pool_size: int = 20
+    http_pool_per_host: int = 10
+    http_dns_cache_ttl: int = 300
+    http_keepalive_timeout: float = 30
+    http_timeout_total: float = 60
+    http_timeout_connect: float = 10
+    http_timeout_read: float = 30
+    web_host: str = "0.0.0.0"
+    web_port: int = 8080
+    notion_webhook_path: str | None = None
+    notion_webhook_token: str | None = None
+    tg_webhook_url: str | None = None
+    tg_webhook_path: str = "/telegram/webhook"
+    tg_webhook_secret: str | None = None
+    tg_send_concurrency: int = 10
+    tg_global_rate: float = 25
+    tg_chat_rate: float = 1
+    outbox_path: str | None = None
+    outbox_coalesce_window: float = 2
+    outbox_max_attempts: int = 10
+    name: str = "default"
+    tenants: list[dict] = []
+    scheduler_workers: int = 4
+    scheduler_shards: int = 1
+    scheduler_leases_path: str | None = None
+    fsm_storage: str = "memory"
+    fsm_path: str | None = None
+    fsm_redis_url: str | None = None
+    fsm_ttl: float = 86400
+    fsm_flush_interval: float = 5
+    property_names: dict[str, str] = {}
+    schema_refresh_interval: int = 3600
+    metrics_path: str | None = None
+    metrics_port: int = 9100
 
     def __init__(self, path: str):
         self._path = path
@@ -21,6 +69,26 @@ class FileConfig:
             data = yaml.safe_load(file)
             self.__dict__.update(**data)
 
+    def for_tenant(self, data: dict) -> "FileConfig":
+        # незаданные у тенанта параметры берутся из общего конфига
+        tenant = copy.copy(self)
+        tenant.__dict__.update(**data)
+        if "name" not in data:
+            tenant.name = tenant.db_id
+        return tenant
+
+    def get_tenants(self) -> list["FileConfig"]:
+        if not self.tenants:
+            return [self]
+        return [self.for_tenant(data) for data in self.tenants]
+
+    def validate_shards(self):
+        # без общей таблицы напоминаний шарды отправят напоминание дважды
+        # при переезде тенанта или перезапуске
+        assert (
+            self.scheduler_shards <= 1 or self.scheduler_leases_path is not None
+        ), "При scheduler_shards > 1 нужно указать scheduler_leases_path!"
+
     def validate_daily_notes(self):
         for note in self.daily_notes:
             assert (
@@ -31,5 +99,6 @@ class FileConfig:
             assert len(note["title"]) > 1, "У заметки должен быть заголовок!"
 
 
+@lru_cache(maxsize=None)
 def get_config() -> FileConfig:
     return FileConfig(os.environ.get("CONFIG_FILE", "config.yaml"))
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import asyncio
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from api.limiter import TokenBucket
+from logger import get_logger
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+
+class MessageDelivery:
+    bot: Bot
+    max_retries: int
+    chat_rate: float
+    _semaphore: asyncio.Semaphore
+    _global_limiter: TokenBucket
+    _chat_limiters: dict[int, TokenBucket]
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int,
+        global_rate: float,
+        chat_rate: float,
+        max_retries: int = 3,
+    ):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.chat_rate = chat_rate
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._global_limiter = TokenBucket(global_rate)
+        self._chat_limiters = {}
+
+    def _chat_limiter(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_limiters:
+            self._chat_limiters[chat_id] = TokenBucket(self.chat_rate, 1)
+        return self._chat_limiters[chat_id]
+
+    async def send(self, chat_id: int, text: str) -> float:
+        started = time.monotonic()
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                await self._chat_limiter(chat_id).acquire()
+                await self._global_limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id, text)
+                    return time.monotonic() - started
+                except TelegramRetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    logger.warning(
+                        "Telegram просит подождать %d с перед отправкой в %d"
+                        % (e.retry_after, chat_id)
+                    )
+                    self._chat_limiter(chat_id).pause(e.retry_after)
+                    await asyncio.sleep(e.retry_after)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+import asyncio
+import datetime
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+from aiogram import Bot
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from api.codec import JsonCodec, default_codec
+from config import FileConfig
+from logger import get_logger
+import logging
+
+try:
+    from aiogram.fsm.storage.redis import RedisStorage
+except ImportError:  # pragma: no cover
+    RedisStorage = None
+
+logger = get_logger(__name__, logging.INFO)
+
+DATETIME_TAG = "__datetime__"
+
+
+def encode_state_data(value: Any) -> Any:
+    # даты заметки хранятся в данных состояния и должны пережить JSON
+    if isinstance(value, datetime.datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    if isinstance(value, dict):
+        return {key: encode_state_data(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode_state_data(item) for item in value]
+    return value
+
+
+def decode_state_data(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and DATETIME_TAG in value:
+            return datetime.datetime.fromisoformat(value[DATETIME_TAG])
+        return {key: decode_state_data(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_state_data(item) for item in value]
+    return value
+
+
+def storage_key(key: StorageKey) -> str:
+    return "%d:%d:%d:%s" % (key.bot_id, key.chat_id, key.user_id, key.destiny)
+
+
+class StateRecord:
+    __slots__ = ("state", "data", "updated_at")
+    state: str | None
+    data: dict
+    updated_at: float
+
+    def __init__(self, state: str | None, data: dict, updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+
+class SqliteStorage(BaseStorage):
+    ttl: float
+    flush_interval: float
+    codec: JsonCodec
+    _connection: sqlite3.Connection
+    _records: dict[str, StateRecord]
+    _dirty: set[str]
+    _flusher: asyncio.Task | None
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        flush_interval: float,
+        codec: JsonCodec | None = None,
+    ):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.codec = codec if codec is not None else default_codec()
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS fsm_states_updated_idx
+                ON fsm_states (updated_at);
+            """)
+        self._records = {}
+        self._dirty = set()
+        self._flusher = None
+
+    @property
+    def write_behind(self) -> bool:
+        return self.flush_interval > 0
+
+    def _load(self, key: str) -> StateRecord:
+        now = time.time()
+        # без отложенной записи каждое чтение идет в файл, чтобы видеть
+        # изменения других процессов
+        record = self._records.get(key) if self.write_behind else None
+        if record is not None and now - record.updated_at < self.ttl:
+            return record
+        row = self._connection.execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[2] >= self.ttl:
+            record = StateRecord(None, {}, now)
+        else:
+            record = StateRecord(
+                row[0], decode_state_data(self.codec.loads(row[1])), row[2]
+            )
+        if self.write_behind:
+            self._records[key] = record
+        return record
+
+    def _store(self, key: str, record: StateRecord):
+        record.updated_at = time.time()
+        if not self.write_behind:
+            self._write(key, record)
+            self._connection.commit()
+            return
+        self._records[key] = record
+        self._dirty.add(key)
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+
+    def _write(self, key: str, record: StateRecord):
+        if record.state is None and not record.data:
+            self._connection.execute("DELETE FROM fsm_states WHERE key = ?", (key,))
+            return
+        self._connection.execute(
+            "INSERT OR REPLACE INTO fsm_states VALUES (?, ?, ?, ?)",
+            (
+                key,
+                record.state,
+                self.codec.dumps(encode_state_data(record.data)),
+                record.updated_at,
+            ),
+        )
+
+    def flush(self):
+        for key in self._dirty:
+            self._write(key, self._records[key])
+        self._dirty = set()
+        expired_before = time.time() - self.ttl
+        self._connection.execute(
+            "DELETE FROM fsm_states WHERE updated_at < ?", (expired_before,)
+        )
+        self._connection.commit()
+        for key in [
+            key
+            for key, record in self._records.items()
+            if record.updated_at < expired_before
+        ]:
+            del self._records[key]
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error("Не удалось сохранить состояния диалогов: %s" % e)
+
+    async def set_state(
+        self, bot: Bot, key: StorageKey, state: StateType = None
+    ) -> None:
+        record = self._load(storage_key(key))
+        self._store(
+            storage_key(key),
+            StateRecord(
+                state.state if isinstance(state, State) else state, record.data, 0
+            ),
+        )
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        return self._load(storage_key(key)).state
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._load(storage_key(key))
+        self._store(storage_key(key), StateRecord(record.state, data.copy(), 0))
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        return self._load(storage_key(key)).data.copy()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+        self._connection.close()
+
+
+class EncodedStorage(BaseStorage):
+    storage: BaseStorage
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def set_state(
+        self, bot: Bot, key: StorageKey, state: StateType = None
+    ) -> None:
+        await self.storage.set_state(bot, key, state)
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        return await self.storage.get_state(bot, key)
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.storage.set_data(bot, key, encode_state_data(data))
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        return decode_state_data(await self.storage.get_data(bot, key))
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+def create_fsm_storage(config: FileConfig) -> BaseStorage:
+    match config.fsm_storage:
+        case "memory":
+            return MemoryStorage()
+        case "sqlite":
+            assert config.fsm_path is not None, "Не указан путь fsm_path!"
+            return SqliteStorage(
+                config.fsm_path, config.fsm_ttl, config.fsm_flush_interval
+            )
+        case "redis":
+            assert RedisStorage is not None, "Не установлен пакет redis!"
+            assert config.fsm_redis_url is not None, "Не указан fsm_redis_url!"
+            ttl = int(config.fsm_ttl)
+            return EncodedStorage(
+                RedisStorage.from_url(config.fsm_redis_url, state_ttl=ttl, data_ttl=ttl)
+            )
+    raise ValueError("Неизвестное хранилище состояний: %s" % config.fsm_storage)
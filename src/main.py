@@ -1,55 +1,196 @@
-from api.api import NotionApi
 from config import get_config
 import asyncio
+import signal
+from contextlib import suppress
+from typing import Coroutine
 from aiogram import Bot, Dispatcher
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from aiogram.types import Message
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from web import run_web_app
 from routes import common, note_creating, note_querying
+from tenants import Tenants
+from fsm import create_fsm_storage
+from metrics import HandlerMetricsMiddleware, setup_metrics
 from logger import get_logger
 import logging
 
 logger = get_logger(__name__, logging.INFO)
 CONFIG = get_config()
-CONFIG.validate_daily_notes()
 
-loop = asyncio.new_event_loop()
-api = NotionApi(CONFIG, loop)
-asyncio.set_event_loop(loop)
+# сколько ждать обработку принятых обновлений при остановке
+SHUTDOWN_TIMEOUT = 30
 
 
-class ACLMiddleware(BaseMiddleware):
-    async def __call__(self, handler, event: Message, data: dict):
-        if event.from_user is None or event.from_user.id not in CONFIG.tg_ids:
-            return
-        return await handler(event, data)
+class TenantMiddleware(BaseMiddleware):
+    tenants: Tenants
 
+    def __init__(self, tenants: Tenants):
+        self.tenants = tenants
 
-class ApiClientPassMiddleware(BaseMiddleware):
     async def __call__(self, handler, event: Message, data: dict):
-        data["api_client"] = api
+        # пользователи, не относящиеся ни к одному тенанту, игнорируются
+        if event.from_user is None:
+            return
+        tenant = self.tenants.for_user(event.from_user.id)
+        if tenant is None:
+            return
+        data["api_client"] = tenant.api
+        data["config"] = tenant.config
         return await handler(event, data)
 
 
-async def main():
-    dp = Dispatcher()
-    dp.message.middleware(ACLMiddleware())
-    bot = Bot(CONFIG.tg_token)
+def create_dispatcher(tenants: Tenants) -> Dispatcher:
+    dp = Dispatcher(storage=create_fsm_storage(CONFIG))
+    # внешний middleware, чтобы конфиг тенанта был доступен фильтрам роутеров
+    dp.message.outer_middleware(TenantMiddleware(tenants))
+    dp.message.middleware(HandlerMetricsMiddleware())
 
-    note_creating.router.message.middleware(ApiClientPassMiddleware())
-    note_querying.router.message.middleware(ApiClientPassMiddleware())
     dp.include_router(common.router)
     dp.include_router(note_querying.router)
     dp.include_router(note_creating.router)
+    return dp
+
+
+class SecretRequestHandler(SimpleRequestHandler):
+    secret: str | None
+    _pending: set[asyncio.Task]
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret: str | None):
+        super().__init__(dispatcher, bot, handle_in_background=True)
+        self.secret = secret
+        self._pending = set()
+
+    async def _handle_request_background(
+        self, bot: Bot, request: web.Request
+    ) -> web.Response:
+        # Telegram уже получил ответ, поэтому задачи обработки отслеживаются,
+        # чтобы дождаться их при остановке
+        task = asyncio.create_task(
+            self._background_feed_update(
+                bot=bot, update=await request.json(loads=bot.session.json_loads)
+            )
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        if self._pending:
+            logger.info("Ожидание обработки обновлений: %d" % len(self._pending))
+            _, pending = await asyncio.wait(self._pending, timeout=SHUTDOWN_TIMEOUT)
+            if pending:
+                logger.error("Не дождались обработки обновлений: %d" % len(pending))
+        await super().close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if (
+            self.secret is not None
+            and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret
+        ):
+            return web.Response(status=401)
+        return await super().handle(request)
 
+
+def setup_telegram_webhook(app: web.Application, dp: Dispatcher, bot: Bot):
+    assert CONFIG.tg_webhook_url is not None
+
+    async def on_startup(*args, **kwargs):
+        # ожидающие обновления не сбрасываются, чтобы не терять их при перезапуске
+        await bot.set_webhook(
+            CONFIG.tg_webhook_url.rstrip("/") + CONFIG.tg_webhook_path,
+            secret_token=CONFIG.tg_webhook_secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+        logger.info("Вебхук Telegram установлен")
+
+    dp.startup.register(on_startup)
+    SecretRequestHandler(dp, bot, CONFIG.tg_webhook_secret).register(
+        app, path=CONFIG.tg_webhook_path
+    )
+    setup_application(app, dp, bot=bot)
+
+
+async def run_bot(dp: Dispatcher, bot: Bot):
     logger.info("Бот начал работу!")
     while True:
+        # сигналы обрабатывает run_until_stopped, иначе остановка
+        # опроса привела бы к его перезапуску
+        polling = asyncio.ensure_future(
+            dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types(),
+                handle_signals=False,
+            )
+        )
         try:
-            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+            await asyncio.shield(polling)
+        except asyncio.CancelledError:
+            # при отмене опрос останавливается штатно, чтобы aiogram завершил
+            # свои задачи и вызвал обработчики shutdown
+            with suppress(RuntimeError):
+                await dp.stop_polling()
+            polling.cancel()
+            raise
         except Exception as e:
             logger.error(str(e))
             await asyncio.sleep(10)
 
 
+async def main(tenants: Tenants):
+    bot = Bot(CONFIG.tg_token)
+    dp = create_dispatcher(tenants)
+    app = web.Application()
+    if CONFIG.metrics_path is not None:
+        setup_metrics(app, CONFIG.metrics_path)
+    tasks = []
+    if CONFIG.tg_webhook_url is not None:
+        setup_telegram_webhook(app, dp, bot)
+    else:
+        tasks.append(run_bot(dp, bot))
+    if app.router.routes():
+        tasks.append(run_web_app(app, CONFIG.web_host, CONFIG.web_port))
+    await run_tasks(tasks)
+
+
+async def run_tasks(coros: list[Coroutine]):
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        # gather отменяет задачи, но не ждет, пока они завершат очистку
+        await asyncio.wait(tasks)
+        raise
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+        raise
+
+
+def run_until_stopped(loop: asyncio.AbstractEventLoop, coro: Coroutine):
+    # по SIGTERM/SIGINT задача отменяется и дожидается своей очистки:
+    # остановки HTTP-сервера с обработчиками on_shutdown и закрытия хранилищ
+    task = loop.create_task(coro)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        logger.info("Работа остановлена по сигналу")
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+
+
 if __name__ == "__main__":
     logger.info("Скрипт запущен!")
-    loop.run_until_complete(main())
+    loop = asyncio.new_event_loop()
+    tenants = Tenants(CONFIG, loop)
+    asyncio.set_event_loop(loop)
+    try:
+        run_until_stopped(loop, main(tenants))
+    finally:
+        loop.run_until_complete(tenants.close())
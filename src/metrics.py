@@ -0,0 +1,266 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import bisect
+import math
+import time
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import Message
+from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)
+        )
+        + "}"
+    )
+
+
+class Metric(ABC):
+    name: str
+    help: str
+    kind: str
+    labelnames: tuple[str, ...]
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        assert set(labels) == set(self.labelnames), "Неверные метки %s" % self.name
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        pass
+
+    def render(self) -> list[str]:
+        return [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s %s" % (self.name, self.kind),
+        ] + self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+    _values: dict[LabelValues, float]
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, value: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        return [
+            "%s%s %s"
+            % (self.name, _format_labels(self.labelnames, key), _format_value(value))
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    buckets: tuple[float, ...]
+    _counts: dict[LabelValues, list[int]]
+    _sums: dict[LabelValues, float]
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        if key not in self._counts:
+            self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0
+        # счетчики хранятся по корзинам, накопленные суммы считаются при выводе
+        self._counts[key][bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self) -> list[str]:
+        lines: list[str] = []
+        bucket_labels = self.labelnames + ("le",)
+        for key, counts in sorted(self._counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (
+                        self.name,
+                        _format_labels(bucket_labels, key + (_format_value(bound),)),
+                        total,
+                    )
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(
+                "%s_sum%s %s" % (self.name, labels, _format_value(self._sums[key]))
+            )
+            lines.append("%s_count%s %d" % (self.name, labels, total))
+        return lines
+
+
+class MetricsRegistry:
+    _metrics: dict[str, Metric]
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        assert metric.name not in self._metrics, "Метрика %s уже есть" % metric.name
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._register(Counter(name, help, labelnames))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(  # type: ignore
+            Histogram(name, help, labelnames, buckets)
+        )
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+NOTION_REQUESTS = REGISTRY.counter(
+    "notion_requests_total",
+    "Запросы к Notion API по итоговому статусу",
+    ("tenant", "endpoint", "status"),
+)
+NOTION_REQUEST_SECONDS = REGISTRY.histogram(
+    "notion_request_duration_seconds",
+    "Длительность запросов к Notion API с учетом повторов",
+    ("tenant", "endpoint"),
+)
+NOTION_RETRIES = REGISTRY.counter(
+    "notion_retries_total",
+    "Повторы запросов к Notion API",
+    ("tenant", "endpoint", "reason"),
+)
+NOTION_REQUEST_BYTES = REGISTRY.counter(
+    "notion_request_bytes_total",
+    "Объем тел запросов к Notion API",
+    ("tenant", "endpoint"),
+)
+NOTION_RESPONSE_BYTES = REGISTRY.counter(
+    "notion_response_bytes_total",
+    "Объем ответов Notion API",
+    ("tenant", "endpoint"),
+)
+NOTION_COALESCED = REGISTRY.counter(
+    "notion_coalesced_queries_total",
+    "Запросы заметок, присоединившиеся к уже выполняющемуся",
+    ("tenant",),
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Время обработки сообщений бота",
+    ("handler", "status"),
+)
+SCHEDULER_DRIFT_SECONDS = REGISTRY.histogram(
+    "scheduler_reminder_drift_seconds",
+    "Опоздание срабатывания напоминания относительно его минуты",
+    ("tenant",),
+    (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+REMINDER_DELIVERY_SECONDS = REGISTRY.histogram(
+    "reminder_delivery_seconds",
+    "Время от постановки сообщения в очередь до его отправки",
+    (),
+    (0.5, 1, 2, 3, 5, 10, 30, 60, 300, 900),
+)
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram(
+    "telegram_send_duration_seconds",
+    "Время отправки одного сообщения получателю с учетом ожидания лимитов",
+)
+OUTBOX_MESSAGES = REGISTRY.counter(
+    "outbox_messages_total",
+    "Сообщения, обработанные очередью отправки",
+    ("result",),
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event: Message, data: dict):
+        # внутренний middleware вызывается только для подошедшего обработчика
+        handler_object = data.get("handler")
+        name = (
+            handler_object.callback.__name__
+            if handler_object is not None
+            else "unknown"
+        )
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            HANDLER_SECONDS.observe(
+                time.perf_counter() - started, handler=name, status=status
+            )
+
+
+def setup_metrics(
+    app: web.Application, path: str, registry: MetricsRegistry = REGISTRY
+):
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    app.router.add_get(path, handle)
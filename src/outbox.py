@@ -0,0 +1,190 @@
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from api.limiter import backoff_delay
+from delivery import MessageDelivery
+from logger import get_logger
+from metrics import (
+    OUTBOX_MESSAGES,
+    REMINDER_DELIVERY_SECONDS,
+    TELEGRAM_SEND_SECONDS,
+)
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Ошибки, после которых повторная отправка не поможет
+FATAL_ERRORS = (TelegramBadRequest, TelegramForbiddenError)
+
+
+def split_text(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    parts: list[str] = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    parts.append(current)
+    # после разрезанной строки остаются переводы строк, а пустые сообщения
+    # Telegram не принимает
+    return [part.strip("\n") for part in parts if part.strip()]
+
+
+class Outbox:
+    delivery: MessageDelivery
+    coalesce_window: float
+    max_attempts: int
+    retry_base_delay: float
+    _connection: sqlite3.Connection
+    _pending: asyncio.Event
+
+    def __init__(
+        self,
+        delivery: MessageDelivery,
+        path: str | None,
+        coalesce_window: float,
+        max_attempts: int,
+        retry_base_delay: float,
+    ):
+        self.delivery = delivery
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self._connection = sqlite3.connect(path if path is not None else ":memory:")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_next_attempt_idx
+                ON outbox (next_attempt_at);
+            """)
+        self._pending = asyncio.Event()
+        if len(self):
+            self._pending.set()
+
+    def enqueue(self, chat_ids: list[int], text: str):
+        now = time.time()
+        self._connection.executemany(
+            "INSERT INTO outbox (chat_id, text, created_at, next_attempt_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(chat_id, text, now, now + self.coalesce_window) for chat_id in chat_ids],
+        )
+        self._connection.commit()
+        self._pending.set()
+
+    def _due_messages(self, now: float) -> dict[int, list[tuple[int, str, int, float]]]:
+        messages: dict[int, list[tuple[int, str, int, float]]] = {}
+        # Вместе с готовым к отправке сообщением уходят все остальные в тот же чат
+        for row_id, chat_id, text, attempts, created_at in self._connection.execute(
+            "SELECT id, chat_id, text, attempts, created_at FROM outbox "
+            "WHERE chat_id IN "
+            "(SELECT chat_id FROM outbox WHERE next_attempt_at <= ?) ORDER BY id",
+            (now,),
+        ):
+            messages.setdefault(chat_id, []).append(
+                (row_id, text, attempts, created_at)
+            )
+        return messages
+
+    def _next_attempt_delay(self, now: float) -> float | None:
+        row = self._connection.execute(
+            "SELECT MIN(next_attempt_at) FROM outbox"
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - now, 0)
+
+    async def _send_chat(
+        self, chat_id: int, messages: list[tuple[int, str, int, float]]
+    ):
+        ids = [row_id for row_id, _, _, _ in messages]
+        attempts = max(attempts for _, _, attempts, _ in messages) + 1
+        created_at = min(created_at for _, _, _, created_at in messages)
+        parts = split_text("\n\n".join(text for _, text, _, _ in messages))
+        sent = 0
+        try:
+            for part in parts:
+                TELEGRAM_SEND_SECONDS.observe(await self.delivery.send(chat_id, part))
+                sent += 1
+            logger.info(
+                "В чат %d отправлено сообщений: %d (частей: %d)"
+                % (chat_id, len(messages), len(parts))
+            )
+            OUTBOX_MESSAGES.inc(len(messages), result="sent")
+            REMINDER_DELIVERY_SECONDS.observe(time.time() - created_at)
+        except FATAL_ERRORS as e:
+            logger.error("Сообщение в чат %d отброшено: %s" % (chat_id, e))
+            OUTBOX_MESSAGES.inc(len(messages), result="dropped")
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                OUTBOX_MESSAGES.inc(len(messages), result="dropped")
+                logger.error(
+                    "Сообщение в чат %d отброшено после %d попыток: %s"
+                    % (chat_id, attempts, e)
+                )
+            else:
+                OUTBOX_MESSAGES.inc(len(messages), result="retried")
+                delay = backoff_delay(attempts, self.retry_base_delay)
+                logger.warning(
+                    "Не удалось отправить сообщение в чат %d, повтор через %.1f с: %s"
+                    % (chat_id, delay, e)
+                )
+                # Уже отправленные части не повторяются
+                now = time.time()
+                self._connection.execute(
+                    "INSERT INTO outbox "
+                    "(chat_id, text, created_at, attempts, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        chat_id,
+                        "\n".join(parts[sent:]),
+                        created_at,
+                        attempts,
+                        now + delay,
+                    ),
+                )
+        self._connection.executemany(
+            "DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in ids]
+        )
+        self._connection.commit()
+
+    async def flush(self):
+        due = self._due_messages(time.time())
+        await asyncio.gather(
+            *[self._send_chat(chat_id, messages) for chat_id, messages in due.items()]
+        )
+
+    async def run(self):
+        while True:
+            try:
+                timeout = self._next_attempt_delay(time.time())
+                try:
+                    await asyncio.wait_for(self._pending.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._pending.clear()
+                await self.flush()
+            except Exception as e:
+                logger.error(str(e))
+                await asyncio.sleep(15)
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import datetime
+import heapq
+import re
+import sqlite3
+from typing import Iterator
+from api.store import to_local_date
+from api.structs import NotionNote
+
+TIME_FLAG_REGEXP = re.compile(r"^t([0-9]{1,2}):([0-9]{2})$")
+OFFSET_FLAG_REGEXP = re.compile(r"^-([0-9]{1,4})([mh])$")
+EVERY_FLAG_REGEXP = re.compile(r"^e([0-9]{1,4})([mh])$")
+UNIT_MINUTES = {"m": 1, "h": 60}
+# начало повторяющихся напоминаний для заметок без времени
+RECURRING_DAY_START = datetime.time(8, 0)
+
+
+def truncate_minute(date: datetime.datetime) -> datetime.datetime:
+    return date.replace(second=0, microsecond=0)
+
+
+def has_time(date: datetime.datetime) -> bool:
+    return date.hour != 0 or date.minute != 0
+
+
+class AtTimeTrigger:
+    __slots__ = ("time",)
+    time: datetime.time
+
+    def __init__(self, time: datetime.time):
+        self.time = time
+
+    def fire_times(
+        self, start: datetime.datetime | None, day: datetime.date
+    ) -> Iterator[datetime.datetime]:
+        yield datetime.datetime.combine(day, self.time)
+
+
+class BeforeStartTrigger:
+    __slots__ = ("offset",)
+    offset: datetime.timedelta
+
+    def __init__(self, offset: datetime.timedelta):
+        self.offset = offset
+
+    def fire_times(
+        self, start: datetime.datetime | None, day: datetime.date
+    ) -> Iterator[datetime.datetime]:
+        if start is None or not has_time(start):
+            return
+        fire_time = start - self.offset
+        if fire_time.date() == day:
+            yield fire_time
+
+
+class RecurringTrigger:
+    __slots__ = ("interval",)
+    interval: datetime.timedelta
+
+    def __init__(self, interval: datetime.timedelta):
+        self.interval = interval
+
+    def fire_times(
+        self, start: datetime.datetime | None, day: datetime.date
+    ) -> Iterator[datetime.datetime]:
+        if start is not None and has_time(start) and start.date() == day:
+            fire_time = start
+        else:
+            fire_time = datetime.datetime.combine(day, RECURRING_DAY_START)
+        while fire_time.date() == day:
+            yield fire_time
+            fire_time += self.interval
+
+
+Trigger = AtTimeTrigger | BeforeStartTrigger | RecurringTrigger
+
+
+def parse_remind_flag(flag: str) -> Trigger | None:
+    flag = flag.strip()
+    match = TIME_FLAG_REGEXP.match(flag)
+    if match is not None:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        return AtTimeTrigger(datetime.time(hour, minute))
+    match = OFFSET_FLAG_REGEXP.match(flag)
+    if match is not None:
+        minutes = int(match.group(1)) * UNIT_MINUTES[match.group(2)]
+        return BeforeStartTrigger(datetime.timedelta(minutes=minutes))
+    match = EVERY_FLAG_REGEXP.match(flag)
+    if match is not None:
+        minutes = int(match.group(1)) * UNIT_MINUTES[match.group(2)]
+        if minutes == 0:
+            return None
+        return RecurringTrigger(datetime.timedelta(minutes=minutes))
+    return None
+
+
+class ReminderIndex:
+    _triggers: dict[str, tuple[tuple[str, ...], list[Trigger]]]
+    _heap: list[datetime.datetime]
+    _minutes: dict[datetime.datetime, list[str]]
+    _notes: dict[str, NotionNote]
+    _fired_until: datetime.datetime | None
+
+    def __init__(self):
+        self._triggers = {}
+        self._heap = []
+        self._minutes = {}
+        self._notes = {}
+        self._fired_until = None
+
+    def _note_triggers(self, note: NotionNote) -> list[Trigger]:
+        assert note.id is not None
+        # last_edited_time округляется до минуты и не отличает правки
+        # в одну минуту, поэтому разбор кэшируется по самим флагам
+        flags = tuple(note.remind.variants)
+        cached = self._triggers.get(note.id)
+        if cached is not None and cached[0] == flags:
+            return cached[1]
+        triggers: list[Trigger] = []
+        for flag in flags:
+            trigger = parse_remind_flag(flag)
+            if trigger is not None:
+                triggers.append(trigger)
+        self._triggers[note.id] = (flags, triggers)
+        return triggers
+
+    def rebuild(self, notes: list[NotionNote], now: datetime.datetime):
+        self._heap = []
+        self._minutes = {}
+        self._notes = {}
+        current_minute = truncate_minute(now)
+        for note in notes:
+            if note.id is None:
+                continue
+            start = to_local_date(note.begin_date_value) if note.date.is_set else None
+            for trigger in self._note_triggers(note):
+                for fire_time in trigger.fire_times(start, now.date()):
+                    fire_time = truncate_minute(fire_time)
+                    if fire_time < current_minute:
+                        continue
+                    # напоминания, которые уже были отправлены до пересинхронизации
+                    if self._fired_until is not None and fire_time <= self._fired_until:
+                        continue
+                    if fire_time not in self._minutes:
+                        self._minutes[fire_time] = []
+                        heapq.heappush(self._heap, fire_time)
+                    if note.id not in self._minutes[fire_time]:
+                        self._minutes[fire_time].append(note.id)
+                        self._notes[note.id] = note
+        # версии удаленных заметок больше не нужны
+        for note_id in self._triggers.keys() - {note.id for note in notes}:
+            del self._triggers[note_id]
+
+    def notes_at(self, minute: datetime.datetime) -> list[NotionNote]:
+        return [self._notes[note_id] for note_id in self._minutes.get(minute, [])]
+
+    def next_fire_time(self) -> datetime.datetime | None:
+        if not self._heap:
+            return None
+        return self._heap[0]
+
+    def pop_due(
+        self, now: datetime.datetime
+    ) -> list[tuple[datetime.datetime, NotionNote]]:
+        due: list[tuple[datetime.datetime, NotionNote]] = []
+        due_ids: set[str | None] = set()
+        while self._heap and self._heap[0] <= now:
+            fire_time = heapq.heappop(self._heap)
+            for note in self.notes_at(fire_time):
+                if note.id not in due_ids:
+                    due_ids.add(note.id)
+                    due.append((fire_time, note))
+            del self._minutes[fire_time]
+            self._fired_until = fire_time
+        return due
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class ReminderLeases:
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: str):
+        # несколько процессов-шардов пишут в один файл
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS reminder_leases (
+                tenant TEXT NOT NULL,
+                note_id TEXT NOT NULL,
+                fire_time TEXT NOT NULL,
+                PRIMARY KEY (tenant, note_id, fire_time)
+            );
+            CREATE INDEX IF NOT EXISTS reminder_leases_time_idx
+                ON reminder_leases (fire_time);
+            """)
+
+    def acquire(self, tenant: str, note_id: str, fire_time: datetime.datetime) -> bool:
+        cursor = self._connection.execute(
+            "INSERT OR IGNORE INTO reminder_leases VALUES (?, ?, ?)",
+            (tenant, note_id, fire_time.isoformat()),
+        )
+        self._connection.commit()
+        return cursor.rowcount == 1
+
+    def prune(self, before: datetime.datetime):
+        self._connection.execute(
+            "DELETE FROM reminder_leases WHERE fire_time < ?", (before.isoformat(),)
+        )
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
@@ -1,5 +1,6 @@
-from typing import Generator
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from typing import Callable, Generator
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
+from config import FileConfig
 
 
 def divide_chunks(lst: list, n: int) -> Generator[list[list], None, None]:
@@ -14,3 +15,11 @@ def make_row_keyboard(items: list[str]) -> ReplyKeyboardMarkup:
         markup.keyboard.append(list(row))  # type: ignore
 
     return markup
+
+
+def config_values_filter(name: str) -> Callable[[Message, FileConfig], bool]:
+    # значения берутся из конфига тенанта, который передает TenantMiddleware
+    def check(message: Message, config: FileConfig) -> bool:
+        return message.text in getattr(config, name)
+
+    return check
@@ -13,14 +13,13 @@ from .date_mapper import (
     TodayDateMapper,
     TomorrowDateMapper,
 )
-from . import make_row_keyboard
-from config import get_config
+from . import make_row_keyboard, config_values_filter
+from config import FileConfig
 from logger import get_logger
 import logging
 
 logger = get_logger(__name__, logging.INFO)
 router = Router()
-CONFIG = get_config()
 
 available_date_mappers: dict[str, AbstractDateMapper] = {
     "Сегодня": TodayDateMapper(),
@@ -47,7 +46,7 @@ async def create_note_in_notion(message: Message, state: FSMContext, api: Notion
     }
 
     data = await state.get_data()
-    note = NotionNote()
+    note = NotionNote(await api.get_schema(api.config.db_id))
     note.date.begin_date = data["begin_date"]
     note.date.end_date = data["end_date"]
     note.category.variants = data["categories"]
@@ -58,7 +57,7 @@ async def create_note_in_notion(message: Message, state: FSMContext, api: Notion
     logger.info("Создаю заметку %s" % note.title_value)
 
     try:
-        await api.create_note(note, CONFIG.db_id)
+        await api.create_note(note, api.config.db_id)
     except Exception as e:
         logger.error("Не удалось создать заметку: %s" % e)
         message_data["text"] = "Ошибка при создании заметки!"
@@ -70,28 +69,30 @@ async def create_note_in_notion(message: Message, state: FSMContext, api: Notion
 
 @router.message(Command("daily"))
 async def create_daily_notes(message: Message, api_client: NotionApi):
-    await api_client.create_today_notes(CONFIG.db_id, CONFIG.daily_notes)
+    await api_client.create_today_notes(
+        api_client.config.db_id, api_client.config.daily_notes
+    )
     await message.reply(f"Созданы недостающие заметки")
 
 
 @router.message(Command("note"))
-async def create_note(message: Message, state: FSMContext):
+async def create_note(message: Message, state: FSMContext, config: FileConfig):
     await message.reply("Введите заголовок заметки: ")
-    await state.update_data(categories=[], progress=CONFIG.progress_values[0])
+    await state.update_data(categories=[], progress=config.progress_values[0])
     await state.set_state(NoteCreatingStage.TITLE)
 
 
 @router.message(NoteCreatingStage.TITLE, F.text.len() > 0)
-async def set_note_title(message: Message, state: FSMContext):
+async def set_note_title(message: Message, state: FSMContext, config: FileConfig):
     await state.update_data(title=message.text)
     await message.reply(
         text="Выберите уровень важности:",
-        reply_markup=make_row_keyboard(CONFIG.importance_values),
+        reply_markup=make_row_keyboard(config.importance_values),
     )
     await state.set_state(NoteCreatingStage.IMPORTANCE)
 
 
-@router.message(NoteCreatingStage.IMPORTANCE, F.text.in_(CONFIG.importance_values))
+@router.message(NoteCreatingStage.IMPORTANCE, config_values_filter("importance_values"))
 async def set_note_importance(message: Message, state: FSMContext):
     await state.update_data(importance=message.text)
     await message.reply(
@@ -102,13 +103,13 @@ async def set_note_importance(message: Message, state: FSMContext):
 
 
 @router.message(NoteCreatingStage.REMIND, F.text.in_(["Да", "Нет"]))
-async def set_note_remind(message: Message, state: FSMContext):
+async def set_note_remind(message: Message, state: FSMContext, config: FileConfig):
     await state.update_data(
-        remind=[] if message.text == "Нет" else CONFIG.default_remind_flags
+        remind=[] if message.text == "Нет" else config.default_remind_flags
     )
     await message.reply(
         text="Введите категории заметки.",
-        reply_markup=make_row_keyboard(CONFIG.categories_values + ["done"]),
+        reply_markup=make_row_keyboard(config.categories_values + ["done"]),
     )
     await state.set_state(NoteCreatingStage.CATEGORIES)
 
@@ -122,18 +123,20 @@ async def end_note_creation(message: Message, state: FSMContext):
     await state.set_state(NoteCreatingStage.DATE)
 
 
-@router.message(NoteCreatingStage.CATEGORIES, F.text.in_(CONFIG.categories_values))
+@router.message(NoteCreatingStage.CATEGORIES, config_values_filter("categories_values"))
 async def note_category_action(message: Message, state: FSMContext):
     assert message.text is not None
-    generate_categories: Callable[
-        [list[str]], str
-    ] = lambda x: "Текущие категории: " + ",".join(x)
-    cat_list: list[str] = (await state.get_data())["categories"]
+    generate_categories: Callable[[list[str]], str] = (
+        lambda x: "Текущие категории: " + ",".join(x)
+    )
+    cat_list: list[str] = list((await state.get_data())["categories"])
     if message.text in cat_list:
         cat_list.pop(cat_list.index(message.text))
+        await state.update_data(categories=cat_list)
         await message.reply(text="Категория удалена!\n" + generate_categories(cat_list))
     else:
         cat_list.append(message.text)
+        await state.update_data(categories=cat_list)
         await message.reply(
             text="Категория добавлена!\n" + generate_categories(cat_list)
         )
@@ -3,35 +3,47 @@ from aiogram import F, Router
 from aiogram.filters.command import Command
 from aiogram.types import Message
 from api.api import NotionApi, NotionNote
-from config import get_config
 from api.properties import CheckboxPageProperty, DatePageProperty, SelectPageProperty
+from api.query import DISPLAY_PROPERTIES, all_of, date_range
 import logging
 from logger import get_logger
 from routes.date_mapper import TodayDateMapper, TomorrowDateMapper
 
 logger = get_logger(__name__, logging.INFO)
 router = Router()
-CONFIG = get_config()
 
 
 @router.message(Command("week"))
 async def get_next_week_notes(message: Message, api_client: NotionApi):
     logger.info("Получаю заметки на неделю.")
-    notes = await api_client.query_notes(
-        CONFIG.db_id,
-        DatePageProperty("Date").next_week_filter,
-        [
-            DatePageProperty("Date").ascending_sort,
-            SelectPageProperty("Importance").descending_sort,
-        ],
-    )
+    schema = await api_client.get_schema(api_client.config.db_id)
+    if api_client.config.incremental_sync:
+        week_begin = TodayDateMapper().get_begin_date()
+        week_end = datetime.datetime.fromtimestamp(
+            week_begin.timestamp() + 8 * 86400 - 1
+        )
+        store = await api_client.get_fresh_store(api_client.config.db_id)
+        notes = store.query(week_begin, week_end)
+    else:
+        notes = [
+            note
+            async for note in api_client.iter_notes(
+                api_client.config.db_id,
+                DatePageProperty(schema.date).next_week_filter,
+                [
+                    DatePageProperty(schema.date).ascending_sort,
+                    SelectPageProperty(schema.importance).descending_sort,
+                ],
+                properties=DISPLAY_PROPERTIES,
+            )
+        ]
     logger.info("Заметки на неделю получены!")
     text = "Заметки на следующую неделю:\n"
-    if not notes.results:
+    if not notes:
         await message.reply("Нет заметок на следующую неделю!")
         return
-    for note in notes.results:
-        text += NotionNote.from_json(note).represent() + "\n"
+    for note in notes:
+        text += note.represent() + "\n"
     await message.reply(text)
 
 
@@ -40,27 +52,31 @@ async def get_tomorrow_notes(message: Message, api_client: NotionApi):
     tomorrow_begin = TomorrowDateMapper().get_begin_date()
     tomorrow_end = datetime.datetime.fromtimestamp(tomorrow_begin.timestamp() + 86399)
     logger.info("Получаю заметки на завтра")
-    notes = await api_client.query_notes(
-        CONFIG.db_id,
-        {
-            "and": [
-                DatePageProperty(
-                    "Date", "Europe/Moscow", tomorrow_begin
-                ).on_or_after_filter,
-                DatePageProperty(
-                    "Date", "Europe/Moscow", tomorrow_end
-                ).on_or_before_filter,
-                SelectPageProperty("Progress", "Завершено").not_equals_filter,
-            ]
-        },
-    )
+    schema = await api_client.get_schema(api_client.config.db_id)
+    if api_client.config.incremental_sync:
+        store = await api_client.get_fresh_store(api_client.config.db_id)
+        notes = store.query(tomorrow_begin, tomorrow_end, "Завершено")
+    else:
+        notes = [
+            note
+            async for note in api_client.iter_notes(
+                api_client.config.db_id,
+                all_of(
+                    date_range(
+                        schema.date, tomorrow_begin, tomorrow_end, "Europe/Moscow"
+                    ),
+                    SelectPageProperty(schema.progress, "Завершено").not_equals_filter,
+                ),
+                properties=DISPLAY_PROPERTIES,
+            )
+        ]
     logger.info("Заметки на завтра получены")
-    if not notes.results:
+    if not notes:
         await message.reply("Заметок на завтра нет!")
         return
     text = "Заметки на завтра:\n"
-    for note in notes.results:
-        text += NotionNote.from_json(note).represent() + "\n"
+    for note in notes:
+        text += note.represent() + "\n"
     await message.reply(text)
 
 
@@ -70,22 +86,28 @@ async def get_today_notes(message: Message, api_client: NotionApi):
     tomorrow = datetime.datetime.fromtimestamp(now.timestamp() + 86399)
 
     logger.info("Получаю заметки на сегодня")
-    notes = await api_client.query_notes(
-        CONFIG.db_id,
-        {
-            "and": [
-                DatePageProperty("Date", "Europe/Moscow", now).on_or_after_filter,
-                DatePageProperty("Date", "Europe/Moscow", tomorrow).on_or_before_filter,
-                SelectPageProperty("Progress", "Завершено").not_equals_filter,
-            ]
-        },
-        [DatePageProperty("Date").ascending_sort],
-    )
+    schema = await api_client.get_schema(api_client.config.db_id)
+    if api_client.config.incremental_sync:
+        store = await api_client.get_fresh_store(api_client.config.db_id)
+        notes = store.query(now, tomorrow, "Завершено")
+    else:
+        notes = [
+            note
+            async for note in api_client.iter_notes(
+                api_client.config.db_id,
+                all_of(
+                    date_range(schema.date, now, tomorrow, "Europe/Moscow"),
+                    SelectPageProperty(schema.progress, "Завершено").not_equals_filter,
+                ),
+                [DatePageProperty(schema.date).ascending_sort],
+                properties=DISPLAY_PROPERTIES,
+            )
+        ]
     logger.info("Заметки на сегодня получены")
     text = "Заметки на сегодня:\n"
-    if notes.results:
-        for note in notes.results:
-            text += NotionNote.from_json(note).represent() + "\n"
+    if notes:
+        for note in notes:
+            text += note.represent() + "\n"
     else:
         text = "Заметок на сегодня больше нет!"
     await message.reply(text)
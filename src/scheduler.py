@@ -1,54 +1,266 @@
 from api.api import NotionApi
+import queue
+import random
 import time
 from api.structs import NotionNote
-from config import get_config
+from api.query import REMINDER_PROPERTIES
+from config import FileConfig, get_config
 import asyncio
 from aiogram import Bot
 from logger import get_logger
+from metrics import SCHEDULER_DRIFT_SECONDS, setup_metrics
+from reminders import ReminderIndex, ReminderLeases
+from delivery import MessageDelivery
+from outbox import Outbox
+from multiprocessing.queues import Queue
+from shards import ShardSupervisor, shard_tenants
+from tenants import Tenants
+from aiohttp import web
+from web import run_web_app
 import logging
 import datetime
 
 logger = get_logger(__name__, logging.INFO)
 CONFIG = get_config()
-loop = asyncio.new_event_loop()
-api = NotionApi(CONFIG, loop)
-asyncio.set_event_loop(loop)
 
+DAILY_NOTES_TIME = datetime.time(7, 0)
+CHANGES_POLL_INTERVAL = 1
 
-async def send_message(bot: Bot, text: str):
-    for tgid in CONFIG.tg_ids:
-        await bot.send_message(tgid, text)
 
+def next_daily_run(now: datetime.datetime) -> datetime.datetime:
+    run_date = datetime.datetime.combine(now.date(), DAILY_NOTES_TIME)
+    if run_date <= now:
+        run_date += datetime.timedelta(days=1)
+    return run_date
 
-async def main():
-    bot = Bot(CONFIG.tg_token)
-    last_minute = datetime.datetime.fromtimestamp(time.time() - 60).minute
+
+def create_outbox(bot: Bot, shard: int | None = None, shard_count: int = 1) -> Outbox:
+    path = CONFIG.outbox_path
+    if shard is not None and path is not None:
+        # у каждого шарда своя очередь, чтобы сообщения не отправлялись дважды
+        path = "%s.%d" % (path, shard)
+    delivery = MessageDelivery(
+        bot,
+        CONFIG.tg_send_concurrency,
+        CONFIG.tg_global_rate / shard_count,
+        CONFIG.tg_chat_rate,
+    )
+    return Outbox(
+        delivery,
+        path,
+        CONFIG.outbox_coalesce_window,
+        CONFIG.outbox_max_attempts,
+        CONFIG.retry_base_delay,
+    )
+
+
+class ReminderScheduler:
+    api: NotionApi
+    config: FileConfig
+    outbox: Outbox
+    workers: asyncio.Semaphore
+    leases: ReminderLeases | None
+    index: ReminderIndex
+    sync_interval: float
+    _last_sync: float | None
+    _synced_date: datetime.date | None
+    _next_daily: datetime.datetime
+    _sync_requested: asyncio.Event
+
+    def __init__(
+        self,
+        api: NotionApi,
+        outbox: Outbox,
+        workers: asyncio.Semaphore,
+        leases: ReminderLeases | None = None,
+    ):
+        self.api = api
+        self.config = api.config
+        self.outbox = outbox
+        self.workers = workers
+        self.leases = leases
+        self.index = ReminderIndex()
+        self.sync_interval = self.config.sync_interval
+        self._last_sync = None
+        self._synced_date = None
+        self._next_daily = next_daily_run(datetime.datetime.now())
+        self._sync_requested = asyncio.Event()
+        api.change_listeners.append(self._on_database_change)
+
+    def _on_database_change(self, database_id: str):
+        if database_id == self.config.db_id:
+            self.request_sync()
+
+    def request_sync(self):
+        self._sync_requested.set()
+
+    def _sync_needed(self, now: datetime.datetime) -> bool:
+        return (
+            self._last_sync is None
+            or self._sync_requested.is_set()
+            or self._synced_date != now.date()
+            or time.monotonic() - self._last_sync >= self.sync_interval
+        )
+
+    async def sync(self, now: datetime.datetime):
+        self._sync_requested.clear()
+        notes = await self.api.get_today_notes(
+            self.config.db_id, True, REMINDER_PROPERTIES
+        )
+        self.index.rebuild(notes, now)
+        if self._last_sync is None:
+            # разносим периодические синхронизации тенантов по интервалу
+            self._last_sync = time.monotonic() - random.uniform(0, self.sync_interval)
+        else:
+            self._last_sync = time.monotonic()
+        self._synced_date = now.date()
+        if self.leases is not None:
+            self.leases.prune(now - datetime.timedelta(days=1))
+        logger.info(
+            "Заметки %s синхронизированы, запланировано напоминаний: %d"
+            % (self.config.name, len(self.index))
+        )
+
+    def _acquire_leases(
+        self, due: list[tuple[datetime.datetime, NotionNote]]
+    ) -> list[NotionNote]:
+        if self.leases is None:
+            return [note for _, note in due]
+        # напоминание отправляет только тот, кто первым занял его в общей базе
+        return [
+            note
+            for fire_time, note in due
+            if note.id is None
+            or self.leases.acquire(self.config.name, note.id, fire_time)
+        ]
+
+    def fire(self, notes: list[NotionNote]):
+        text = "🔔Напоминание о незавершенных заметках:\n"
+        for note in notes:
+            text += note.represent() + "\n"
+        self.outbox.enqueue(self.config.tg_ids, text)
+
+    def _seconds_until_wakeup(self, now: datetime.datetime) -> float:
+        assert self._last_sync is not None
+        next_midnight = datetime.datetime.combine(
+            now.date() + datetime.timedelta(days=1), datetime.time()
+        )
+        wakeups = [
+            self._next_daily,
+            next_midnight,
+            now
+            + datetime.timedelta(
+                seconds=self.sync_interval - (time.monotonic() - self._last_sync)
+            ),
+        ]
+        next_fire = self.index.next_fire_time()
+        if next_fire is not None:
+            wakeups.append(next_fire)
+        return max((min(wakeups) - now).total_seconds(), 0)
+
+    async def _wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._sync_requested.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        while True:
+            try:
+                now = datetime.datetime.now()
+                if now >= self._next_daily:
+                    async with self.workers:
+                        await self.api.create_today_notes(
+                            self.config.db_id, self.config.daily_notes
+                        )
+                    self._next_daily = next_daily_run(now)
+                    self.request_sync()
+                if self._sync_needed(now):
+                    async with self.workers:
+                        await self.sync(now)
+                due = self.index.pop_due(now)
+                # насколько позже своей минуты срабатывают напоминания
+                for fire_time, _ in due:
+                    SCHEDULER_DRIFT_SECONDS.observe(
+                        (now - fire_time).total_seconds(), tenant=self.config.name
+                    )
+                due_notes = self._acquire_leases(due)
+                if due_notes:
+                    self.fire(due_notes)
+                await self._wait(self._seconds_until_wakeup(datetime.datetime.now()))
+            except Exception as e:
+                logger.error(str(e))
+                await asyncio.sleep(15)
+
+
+def create_schedulers(tenants: Tenants, outbox: Outbox) -> list[ReminderScheduler]:
+    # общий пул ограничивает число тенантов, одновременно обращающихся к Notion
+    workers = asyncio.Semaphore(CONFIG.scheduler_workers)
+    leases = None
+    if CONFIG.scheduler_leases_path is not None:
+        leases = ReminderLeases(CONFIG.scheduler_leases_path)
+    return [
+        ReminderScheduler(tenant.api, outbox, workers, leases) for tenant in tenants
+    ]
+
+
+async def receive_changes(changes: Queue, schedulers: list[ReminderScheduler]):
+    by_tenant = {scheduler.config.name: scheduler for scheduler in schedulers}
+    loop = asyncio.get_running_loop()
     while True:
         try:
-            now_date = datetime.datetime.now()
-            if now_date.minute == last_minute:
-                await asyncio.sleep(5)
-                continue
-            last_minute = now_date.minute
-            notes = await api.get_today_notes(CONFIG.db_id, True)
-            timeflag = f't{now_date.strftime("%H:%M")}'
-            if timeflag == "t07:00":
-                await api.create_today_notes(CONFIG.db_id, CONFIG.daily_notes)
-
-            filtered_notes: list[NotionNote] = list(
-                filter(lambda x: timeflag in x.remind.variants, notes)
+            tenant_name = await loop.run_in_executor(
+                None, changes.get, True, CHANGES_POLL_INTERVAL
             )
-            if not filtered_notes:
-                continue
-            text = "🔔Напоминание о незавершенных заметках:\n"
-            for note in filtered_notes:
-                text += note.represent() + "\n"
-            await send_message(bot, text)
-        except Exception as e:
-            logger.error(str(e))
-            await asyncio.sleep(15)
+        except queue.Empty:
+            continue
+        scheduler = by_tenant.get(tenant_name)
+        if scheduler is not None:
+            scheduler.api.notify_change(scheduler.config.db_id)
+
+
+async def main(
+    tenants: Tenants,
+    shard: int | None = None,
+    shard_count: int = 1,
+    changes: Queue | None = None,
+):
+    outbox = create_outbox(Bot(CONFIG.tg_token), shard, shard_count)
+    schedulers = create_schedulers(tenants, outbox)
+    tasks = [outbox.run()]
+    tasks += [scheduler.run() for scheduler in schedulers]
+    if changes is not None:
+        tasks.append(receive_changes(changes, schedulers))
+    if CONFIG.metrics_path is not None:
+        # каждый шард отдает метрики на своем порту, начиная с metrics_port
+        app = web.Application()
+        setup_metrics(app, CONFIG.metrics_path)
+        port = CONFIG.metrics_port + (shard if shard is not None else 0)
+        tasks.append(run_web_app(app, CONFIG.web_host, port))
+    await asyncio.gather(*tasks)
+
+
+def run_shard(shard: int, shard_count: int, changes: Queue | None = None):
+    loop = asyncio.new_event_loop()
+    tenants = Tenants(CONFIG, loop, shard_tenants(CONFIG, shard, shard_count))
+    asyncio.set_event_loop(loop)
+    logger.info("Шард %d запущен, тенантов: %d" % (shard, len(tenants)))
+    try:
+        loop.run_until_complete(main(tenants, shard, shard_count, changes))
+    finally:
+        loop.run_until_complete(tenants.close())
 
 
 if __name__ == "__main__":
     logger.info("Скрипт проверок запущен!")
-    loop.run_until_complete(main())
+    if CONFIG.scheduler_shards > 1:
+        CONFIG.validate_shards()
+        asyncio.run(ShardSupervisor(run_shard, CONFIG.scheduler_shards).run())
+    else:
+        loop = asyncio.new_event_loop()
+        tenants = Tenants(CONFIG, loop)
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(main(tenants))
+        finally:
+            loop.run_until_complete(tenants.close())
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import time
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Callable
+from config import FileConfig
+from logger import get_logger
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+RING_REPLICAS = 100
+SUPERVISOR_CHECK_INTERVAL = 1
+RESTART_MAX_DELAY = 60
+# шард, проработавший дольше, считается здоровым и перезапускается без задержки
+HEALTHY_UPTIME = 300
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    _keys: list[int]
+    _shards: list[int]
+
+    def __init__(self, shard_count: int, replicas: int = RING_REPLICAS):
+        points = sorted(
+            (ring_hash("shard-%d-%d" % (shard, replica)), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def get(self, key: str) -> int:
+        index = bisect.bisect(self._keys, ring_hash(key)) % len(self._keys)
+        return self._shards[index]
+
+
+def shard_tenants(config: FileConfig, shard: int, shard_count: int) -> set[str]:
+    ring = HashRing(shard_count)
+    return {
+        tenant.name for tenant in config.get_tenants() if ring.get(tenant.name) == shard
+    }
+
+
+class ShardSupervisor:
+    target: Callable[[int, int, Queue], None]
+    shard_count: int
+    ring: HashRing
+    _context: multiprocessing.context.SpawnContext
+    _changes: dict[int, Queue]
+    _processes: dict[int, BaseProcess]
+    _started: dict[int, float]
+    _failures: dict[int, int]
+    _restart_at: dict[int, float]
+
+    def __init__(self, target: Callable[[int, int, Queue], None], shard_count: int):
+        self.target = target
+        self.shard_count = shard_count
+        self.ring = HashRing(shard_count)
+        # spawn, чтобы шард не наследовал цикл событий и соединения родителя
+        self._context = multiprocessing.get_context("spawn")
+        # очереди переживают перезапуск шарда, изменения не теряются
+        self._changes = {shard: self._context.Queue() for shard in range(shard_count)}
+        self._processes = {}
+        self._started = {}
+        self._failures = {}
+        self._restart_at = {}
+
+    def _start(self, shard: int):
+        process = self._context.Process(
+            target=self.target,
+            args=(shard, self.shard_count, self._changes[shard]),
+            name="scheduler-shard-%d" % shard,
+            daemon=True,
+        )
+        process.start()
+        self._processes[shard] = process
+        self._started[shard] = time.monotonic()
+
+    def _check(self, shard: int):
+        now = time.monotonic()
+        process = self._processes.get(shard)
+        if process is not None and process.is_alive():
+            return
+        if process is not None:
+            if now - self._started[shard] >= HEALTHY_UPTIME:
+                self._failures[shard] = 0
+            self._failures[shard] = self._failures.get(shard, 0) + 1
+            delay = min(2 ** (self._failures[shard] - 1), RESTART_MAX_DELAY)
+            logger.error(
+                "Шард %d завершился с кодом %s, перезапуск через %d с"
+                % (shard, process.exitcode, delay)
+            )
+            self._processes.pop(shard)
+            self._restart_at[shard] = now + delay
+        if now >= self._restart_at.get(shard, 0):
+            self._start(shard)
+
+    def notify_change(self, tenant_name: str):
+        # изменения базы, полученные ботом или вебхуком, передаются шарду тенанта
+        self._changes[self.ring.get(tenant_name)].put_nowait(tenant_name)
+
+    def stop(self):
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join(5)
+        self._processes = {}
+
+    async def run(self):
+        logger.info("Запуск %d шардов планировщика" % self.shard_count)
+        try:
+            while True:
+                for shard in range(self.shard_count):
+                    self._check(shard)
+                await asyncio.sleep(SUPERVISOR_CHECK_INTERVAL)
+        finally:
+            self.stop()
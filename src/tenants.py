@@ -0,0 +1,78 @@
+from __future__ import annotations
+import asyncio
+from typing import Iterator
+import aiohttp
+from api.api import NotionApi, create_connector
+from config import FileConfig
+from logger import get_logger
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+
+class Tenant:
+    config: FileConfig
+    api: NotionApi
+
+    def __init__(self, config: FileConfig, api: NotionApi):
+        self.config = config
+        self.api = api
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+
+class Tenants:
+    connector: aiohttp.TCPConnector
+    _tenants: list[Tenant]
+    _by_user: dict[int, Tenant]
+
+    def __init__(
+        self,
+        config: FileConfig,
+        event_loop: asyncio.AbstractEventLoop,
+        names: set[str] | None = None,
+    ):
+        # один пул соединений на все тенанты, лимиты и кэш у каждого свои
+        self.connector = event_loop.run_until_complete(self._init_connector(config))
+        self._tenants = []
+        self._by_user = {}
+        for tenant_config in config.get_tenants():
+            if names is not None and tenant_config.name not in names:
+                continue
+            tenant_config.validate_daily_notes()
+            tenant = Tenant(
+                tenant_config,
+                NotionApi(tenant_config, event_loop, connector=self.connector),
+            )
+            event_loop.run_until_complete(
+                tenant.api.validate_schema(tenant_config.db_id)
+            )
+            self._tenants.append(tenant)
+            for user_id in tenant_config.tg_ids:
+                if user_id in self._by_user:
+                    logger.warning(
+                        "Пользователь %d уже относится к тенанту %s"
+                        % (user_id, self._by_user[user_id].name)
+                    )
+                    continue
+                self._by_user[user_id] = tenant
+        logger.info("Загружено тенантов: %d" % len(self._tenants))
+
+    async def _init_connector(self, config: FileConfig) -> aiohttp.TCPConnector:
+        return create_connector(config)
+
+    def for_user(self, user_id: int) -> Tenant | None:
+        return self._by_user.get(user_id)
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(self._tenants)
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    async def close(self):
+        for tenant in self._tenants:
+            await tenant.api.close()
+        await self.connector.close()
@@ -0,0 +1,18 @@
+from aiohttp import web
+import asyncio
+from logger import get_logger
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+
+async def run_web_app(app: web.Application, host: str, port: int):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("HTTP-сервер запущен на %s:%d" % (host, port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
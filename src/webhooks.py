@@ -0,0 +1,125 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import hmac
+from aiohttp import web
+from api.api import NotionApi, NotionApiError
+from api.structs import NotionNote
+from logger import get_logger
+import logging
+
+logger = get_logger(__name__, logging.INFO)
+
+UPSERT_EVENTS = {
+    "page.created",
+    "page.properties_updated",
+    "page.content_updated",
+    "page.moved",
+    "page.undeleted",
+}
+DELETE_EVENTS = {"page.deleted"}
+
+
+def normalize_id(value: str) -> str:
+    return value.replace("-", "").lower()
+
+
+def sign_body(body: bytes, verification_token: str) -> str:
+    digest = hmac.new(verification_token.encode(), body, hashlib.sha256).hexdigest()
+    return "sha256=%s" % digest
+
+
+class NotionWebhookHandler:
+    api: NotionApi
+    database_id: str
+    verification_token: str | None
+    _tasks: set[asyncio.Task]
+
+    def __init__(
+        self, api: NotionApi, database_id: str, verification_token: str | None
+    ):
+        self.api = api
+        self.database_id = database_id
+        self.verification_token = verification_token
+        self._tasks = set()
+
+    def _is_signed(self, request: web.Request, body: bytes) -> bool:
+        if self.verification_token is None:
+            return True
+        signature = request.headers.get("X-Notion-Signature", "")
+        return hmac.compare_digest(signature, sign_body(body, self.verification_token))
+
+    async def __call__(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            event: dict = self.api.codec.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        if "verification_token" in event:
+            logger.info(
+                "Получен токен подтверждения вебхука Notion: %s"
+                % event["verification_token"]
+            )
+            return web.Response(status=200)
+        if not self._is_signed(request, body):
+            logger.warning("Вебхук Notion с неверной подписью отклонен")
+            return web.Response(status=401)
+        if event.get("entity", {}).get("type") != "page":
+            return web.Response(status=200)
+        parent: dict = event.get("data", {}).get("parent", {})
+        if parent.get("type") == "database" and normalize_id(
+            parent.get("id", "")
+        ) != normalize_id(self.database_id):
+            return web.Response(status=200)
+        # Notion ждет быстрый ответ, поэтому событие обрабатывается в фоне
+        task = asyncio.create_task(self.handle_event(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def handle_event(self, event: dict):
+        page_id: str = event["entity"]["id"]
+        store = self.api.get_store(self.database_id)
+        try:
+            if event["type"] in DELETE_EVENTS:
+                store.remove(page_id)
+            elif event["type"] in UPSERT_EVENTS:
+                page = await self.api.get_page(page_id)
+                parent: dict = page.get("parent", {})
+                if normalize_id(parent.get("database_id", "")) != normalize_id(
+                    self.database_id
+                ):
+                    store.remove(page_id)
+                elif page.get("in_trash"):
+                    store.remove(page_id)
+                else:
+                    schema = await self.api.get_schema(self.database_id)
+                    # курсор не сдвигается, чтобы не пропустить более ранние правки
+                    store.upsert(
+                        NotionNote.from_json(page, schema), advance_cursor=False
+                    )
+            else:
+                return
+        except NotionApiError as e:
+            if e.status != 404:
+                logger.error("Не удалось обработать вебхук Notion: %s" % e)
+                return
+            store.remove(page_id)
+        except Exception as e:
+            logger.error("Не удалось обработать вебхук Notion: %s" % e)
+            return
+        store.commit()
+        logger.info("Вебхук Notion: %s %s" % (event["type"], page_id))
+        self.api.notify_change(self.database_id)
+
+
+def setup_notion_webhook(
+    app: web.Application,
+    api: NotionApi,
+    path: str,
+    database_id: str,
+    verification_token: str | None,
+):
+    app.router.add_post(
+        path, NotionWebhookHandler(api, database_id, verification_token)
+    )
@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+import time
+import pytest
+from api.api import NotionApi
+from api.structs import NoteSchema, NotionNote
+from config import FileConfig
+
+DB = "db"
+
+
+def page(note_id: str, edited: str) -> dict:
+    return {"id": note_id, "last_edited_time": edited, "properties": {}}
+
+
+def result(pages: list[dict], next_cursor: str | None = None) -> dict:
+    return {
+        "results": pages,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor,
+    }
+
+
+class FakeNotion:
+    def __init__(self):
+        self.queries: list[dict] = []
+        self.pages: dict[str | None, dict | Exception] = {}
+        self.release: asyncio.Event | None = None
+
+    async def request(self, method: str, path: str, json=None, params=None, **_):
+        if path == "/v1/pages":
+            return {"id": "new"}
+        self.queries.append(json)
+        # ответ соответствует моменту получения запроса
+        answer = self.pages[json.get("start_cursor")]
+        if self.release is not None:
+            await self.release.wait()
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def make_api(tmp_path):
+    loop = asyncio.new_event_loop()
+    apis: list[NotionApi] = []
+
+    def make(**options) -> tuple[NotionApi, FakeNotion]:
+        path = tmp_path / "config.yaml"
+        path.write_text("token: secret\ndb_id: %s\n" % DB)
+        config = FileConfig(str(path))
+        config.__dict__.update(options)
+        api = NotionApi(config, loop)
+        api.schemas[DB] = (NoteSchema(), time.monotonic())
+        fake = FakeNotion()
+        api._request = fake.request  # type: ignore
+        apis.append(api)
+        return api, fake
+
+    yield make, loop.run_until_complete
+    for api in apis:
+        loop.run_until_complete(api.close())
+    loop.close()
+
+
+def test_sync_keeps_cursor_when_later_page_fails(make_api):
+    make, run = make_api
+    api, fake = make(incremental_sync=True)
+    fake.pages[None] = result([page("a", "2026-03-10T08:00:00.000Z")])
+    run(api.sync_notes(DB, full=True))
+    store = api.get_store(DB)
+    assert store.cursor == "2026-03-10T08:00:00.000Z"
+
+    fake.pages[None] = result([page("b", "2026-03-10T09:30:00.000Z")], "page2")
+    fake.pages["page2"] = ConnectionError("обрыв")
+    with pytest.raises(ConnectionError):
+        run(api.sync_notes(DB))
+    assert store.cursor == "2026-03-10T08:00:00.000Z"
+
+    fake.pages[None] = result(
+        [page("b", "2026-03-10T09:30:00.000Z"), page("c", "2026-03-10T09:10:00.000Z")]
+    )
+    run(api.sync_notes(DB))
+    assert fake.queries[-1]["filter"]["last_edited_time"] == {
+        "on_or_after": "2026-03-10T08:00:00.000Z"
+    }
+    assert store.get("c") is not None
+    assert store.cursor == "2026-03-10T09:30:00.000Z"
+
+
+def test_query_finished_after_write_is_not_cached(make_api):
+    make, run = make_api
+    api, fake = make()
+    fake.pages[None] = result([page("p0", "2026-03-10T08:00:00.000Z")])
+    fake.release = asyncio.Event()
+    note = NotionNote()
+    note.title.text = "новая"
+    note.remind.variants = []
+    note.category.variants = []
+    note.importance.selected = "Важно"
+    note.progress.selected = "Не начато"
+    note.date.begin_date = datetime.datetime(2026, 3, 10, 9)
+    note.date.end_date = None
+
+    async def scenario():
+        reading = asyncio.ensure_future(api.query_notes(DB))
+        while not fake.queries:
+            await asyncio.sleep(0)
+        await api.create_note(note, DB)
+        fake.pages[None] = result([page("p1", "2026-03-10T08:01:00.000Z")])
+        fake.release.set()
+        assert [note.id for note in await reading] == ["p0"]
+        return await api.query_notes(DB)
+
+    assert [note.id for note in run(scenario())] == ["p1"]
+    assert len(fake.queries) == 2
+
+
+def test_coalesced_query_started_before_invalidation_is_not_cached(make_api):
+    make, run = make_api
+    api, fake = make()
+    fake.pages[None] = result([page("p0", "2026-03-10T08:00:00.000Z")])
+    fake.release = asyncio.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(api.query_notes(DB))
+        while not fake.queries:
+            await asyncio.sleep(0)
+        joined = asyncio.ensure_future(api.query_notes(DB))
+        await asyncio.sleep(0)
+        api.cache.invalidate(DB)
+        fake.pages[None] = result([page("p1", "2026-03-10T08:01:00.000Z")])
+        fresh = asyncio.ensure_future(api.query_notes(DB))
+        await asyncio.sleep(0)
+        fake.release.set()
+        results = await asyncio.gather(first, joined, fresh)
+        return [[note.id for note in res] for res in results] + [
+            [note.id for note in await api.query_notes(DB)]
+        ]
+
+    assert run(scenario()) == [["p0"], ["p0"], ["p1"], ["p1"]]
+    assert api.coalesced == 1
+    assert len(fake.queries) == 2
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+from outbox import TELEGRAM_MESSAGE_LIMIT, Outbox, split_text
+
+
+class FakeDelivery:
+    def __init__(self, fail_on: int | None = None, error: Exception | None = None):
+        self.sent: list[tuple[int, str]] = []
+        self.fail_on = fail_on
+        self.error = error
+
+    async def send(self, chat_id: int, text: str) -> float:
+        if self.fail_on is not None and len(self.sent) == self.fail_on:
+            self.fail_on = None
+            raise self.error or ConnectionError("нет сети")
+        self.sent.append((chat_id, text))
+        return 0
+
+
+def make_outbox(delivery: FakeDelivery, coalesce_window: float = 0) -> Outbox:
+    return Outbox(delivery, None, coalesce_window, 3, 0)  # type: ignore
+
+
+def test_split_text_exact_limit_is_one_part():
+    text = "a" * TELEGRAM_MESSAGE_LIMIT
+    assert split_text(text) == [text]
+
+
+def test_split_text_one_char_over_limit():
+    text = "a" * (TELEGRAM_MESSAGE_LIMIT + 1)
+    assert split_text(text) == ["a" * TELEGRAM_MESSAGE_LIMIT, "a"]
+
+
+def test_split_text_lines_filling_limit_stay_together():
+    line = "b" * (TELEGRAM_MESSAGE_LIMIT // 2 - 1) + "\n"
+    assert split_text(line * 2) == [line + line.rstrip("\n")]
+
+
+def test_split_text_breaks_on_line_boundary():
+    line = "c" * 3000 + "\n"
+    assert split_text(line * 2) == ["c" * 3000, "c" * 3000]
+
+
+@pytest.mark.parametrize("text", ["", "\n", "\n\n"])
+def test_split_text_empty(text):
+    assert split_text(text) == []
+
+
+def test_split_text_parts_never_exceed_limit():
+    text = "\n".join("d" * length for length in [10, 5000, 4096, 1, 9000, 4095])
+    parts = split_text(text)
+    assert all(len(part) <= TELEGRAM_MESSAGE_LIMIT for part in parts)
+    assert "".join(parts).replace("\n", "") == text.replace("\n", "")
+
+
+def test_messages_to_one_chat_are_coalesced():
+    delivery = FakeDelivery()
+    outbox = make_outbox(delivery)
+    outbox.enqueue([1], "первое")
+    outbox.enqueue([1, 2], "второе")
+    asyncio.run(outbox.flush())
+    assert sorted(delivery.sent) == [(1, "первое\n\nвторое"), (2, "второе")]
+    assert len(outbox) == 0
+
+
+def test_messages_wait_for_coalesce_window():
+    delivery = FakeDelivery()
+    outbox = make_outbox(delivery, coalesce_window=60)
+    outbox.enqueue([1], "позже")
+    asyncio.run(outbox.flush())
+    assert delivery.sent == []
+    assert len(outbox) == 1
+
+
+def test_failed_send_keeps_only_unsent_parts():
+    delivery = FakeDelivery(fail_on=1)
+    outbox = make_outbox(delivery)
+    outbox.enqueue([1], "e" * TELEGRAM_MESSAGE_LIMIT + "\nхвост")
+    asyncio.run(outbox.flush())
+    assert delivery.sent == [(1, "e" * TELEGRAM_MESSAGE_LIMIT)]
+    assert len(outbox) == 1
+    asyncio.run(outbox.flush())
+    assert delivery.sent[-1] == (1, "хвост")
+    assert len(outbox) == 0
+
+
+def test_fatal_error_drops_message():
+    error = TelegramBadRequest(SendMessage(chat_id=1, text="x"), "chat not found")
+    delivery = FakeDelivery(fail_on=0, error=error)
+    outbox = make_outbox(delivery)
+    outbox.enqueue([1], "никуда")
+    asyncio.run(outbox.flush())
+    assert delivery.sent == []
+    assert len(outbox) == 0
+
+
+def test_split_text_skips_blank_parts():
+    text = "\n\n" + "f" * (TELEGRAM_MESSAGE_LIMIT * 2) + "\n\n"
+    assert split_text(text) == ["f" * TELEGRAM_MESSAGE_LIMIT] * 2
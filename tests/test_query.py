@@ -0,0 +1,115 @@
+import datetime
+from api.query import all_of, any_of, date_range
+
+
+def bound(key: str, value: str, name: str = "Date") -> dict:
+    return {"property": name, "date": {key: value}}
+
+
+DONE = {"property": "Progress", "select": {"does_not_equal": "Завершено"}}
+
+
+def test_all_of_empty():
+    assert all_of() == {}
+    assert all_of({}, {}) == {}
+
+
+def test_all_of_single_condition_is_unwrapped():
+    assert all_of(DONE) == DONE
+    assert all_of({"and": [DONE]}) == DONE
+
+
+def test_all_of_flattens_nested_and_removes_duplicates():
+    other = {"property": "Importance", "select": {"equals": "Важно"}}
+    assert all_of({"and": [DONE, other]}, DONE, {"and": [{"and": [other]}]}) == {
+        "and": [DONE, other]
+    }
+
+
+def test_all_of_keeps_nested_or():
+    either = {"or": [DONE, bound("after", "2026-01-01")]}
+    assert all_of(either, DONE) == {"and": [either, DONE]}
+
+
+def test_overlapping_lower_bounds_keep_the_latest():
+    assert all_of(
+        bound("on_or_after", "2026-01-01"), bound("on_or_after", "2026-01-05")
+    ) == bound("on_or_after", "2026-01-05")
+
+
+def test_overlapping_upper_bounds_keep_the_earliest():
+    assert all_of(
+        bound("on_or_before", "2026-01-05"), bound("before", "2026-01-03")
+    ) == bound("before", "2026-01-03")
+
+
+def test_strict_bound_wins_on_equal_dates():
+    assert all_of(
+        bound("on_or_after", "2026-01-05"), bound("after", "2026-01-05")
+    ) == bound("after", "2026-01-05")
+    assert all_of(
+        bound("before", "2026-01-05"), bound("on_or_before", "2026-01-05")
+    ) == bound("before", "2026-01-05")
+
+
+def test_merged_bound_keeps_its_position():
+    assert all_of(
+        bound("on_or_after", "2026-01-01"), DONE, bound("on_or_after", "2026-01-02")
+    ) == {"and": [bound("on_or_after", "2026-01-02"), DONE]}
+
+
+def test_bounds_compare_dates_with_offsets():
+    later = bound("on_or_after", "2026-01-01T10:00:00+00:00")
+    earlier = bound("on_or_after", "2026-01-01T12:00:00+03:00")
+    assert all_of(earlier, later) == later
+
+
+def test_bounds_of_different_properties_are_not_merged():
+    created = bound("on_or_after", "2026-01-05", "Created")
+    date = bound("on_or_after", "2026-01-01")
+    assert all_of(date, created) == {"and": [date, created]}
+
+
+def test_contradictory_bounds_are_kept():
+    # пустой диапазон отдается Notion как есть, он просто ничего не найдет
+    lower = bound("on_or_after", "2026-01-10")
+    upper = bound("on_or_before", "2026-01-01")
+    assert all_of(lower, upper) == {"and": [lower, upper]}
+
+
+def test_non_bound_date_conditions_are_untouched():
+    equals = bound("equals", "2026-01-01")
+    next_week = {"property": "Date", "date": {"next_week": {}}}
+    assert all_of(equals, next_week, equals) == {"and": [equals, next_week]}
+
+
+def test_any_of_flattens_without_merging_bounds():
+    first = bound("on_or_after", "2026-01-01")
+    second = bound("on_or_after", "2026-01-05")
+    assert any_of({"or": [first]}, second, first) == {"or": [first, second]}
+    assert any_of() == {}
+    assert any_of(first) == first
+
+
+def test_date_range():
+    begin = datetime.datetime(2026, 1, 1)
+    end = datetime.datetime(2026, 1, 1, 23, 59)
+    assert date_range("Date") == {}
+    assert date_range("Date", begin) == bound("on_or_after", "2026-01-01")
+    assert date_range("Date", None, end) == bound("on_or_before", "2026-01-01T23:59:00")
+    assert date_range("Date", begin, end) == {
+        "and": [
+            bound("on_or_after", "2026-01-01"),
+            bound("on_or_before", "2026-01-01T23:59:00"),
+        ]
+    }
+
+
+def test_date_range_narrows_existing_range():
+    wide = date_range(
+        "Date", datetime.datetime(2026, 1, 1), datetime.datetime(2026, 1, 31)
+    )
+    narrow = date_range(
+        "Date", datetime.datetime(2026, 1, 10), datetime.datetime(2026, 1, 20)
+    )
+    assert all_of(wide, narrow) == narrow
@@ -0,0 +1,150 @@
+import datetime
+import pytest
+from api.structs import NotionNote
+from reminders import (
+    AtTimeTrigger,
+    BeforeStartTrigger,
+    RecurringTrigger,
+    ReminderIndex,
+    parse_remind_flag,
+)
+
+DAY = datetime.date(2026, 3, 10)
+
+
+def at(hour: int, minute: int = 0, day: datetime.date = DAY) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(hour, minute))
+
+
+def make_note(
+    note_id: str,
+    flags: list[str],
+    start: datetime.datetime | None = None,
+    edited: str = "2026-03-10T00:00:00.000Z",
+) -> NotionNote:
+    note = NotionNote()
+    note.id = note_id
+    note.last_edited_time = edited
+    note.title.text = note_id
+    note.remind.variants = flags
+    if start is not None:
+        note.date.begin_date = start
+    return note
+
+
+@pytest.mark.parametrize(
+    "flag, trigger_type, value",
+    [
+        ("t08:00", AtTimeTrigger, datetime.time(8, 0)),
+        ("t9:05", AtTimeTrigger, datetime.time(9, 5)),
+        (" t23:59 ", AtTimeTrigger, datetime.time(23, 59)),
+        ("-15m", BeforeStartTrigger, datetime.timedelta(minutes=15)),
+        ("-2h", BeforeStartTrigger, datetime.timedelta(hours=2)),
+        ("e30m", RecurringTrigger, datetime.timedelta(minutes=30)),
+        ("e1h", RecurringTrigger, datetime.timedelta(hours=1)),
+    ],
+)
+def test_parse_remind_flag(flag, trigger_type, value):
+    trigger = parse_remind_flag(flag)
+    assert isinstance(trigger, trigger_type)
+    assert value in [getattr(trigger, slot) for slot in trigger_type.__slots__]
+
+
+@pytest.mark.parametrize(
+    "flag",
+    [
+        "",
+        "t24:00",
+        "t12:60",
+        "t12:5",
+        "t123:00",
+        "12:00",
+        "-15",
+        "-15s",
+        "+15m",
+        "e0m",
+        "e0h",
+        "e-5m",
+        "eh",
+        "-m",
+        "t08:00x",
+        "remind",
+    ],
+)
+def test_parse_malformed_remind_flag(flag):
+    assert parse_remind_flag(flag) is None
+
+
+def test_before_start_ignores_notes_without_time():
+    trigger = BeforeStartTrigger(datetime.timedelta(minutes=30))
+    assert list(trigger.fire_times(None, DAY)) == []
+    assert list(trigger.fire_times(at(0), DAY)) == []
+    assert list(trigger.fire_times(at(10), DAY)) == [at(9, 30)]
+
+
+def test_before_start_crossing_midnight_fires_on_previous_day():
+    trigger = BeforeStartTrigger(datetime.timedelta(hours=1))
+    start = at(0, 30)
+    assert list(trigger.fire_times(start, DAY)) == []
+    assert list(trigger.fire_times(start, DAY - datetime.timedelta(days=1))) == [
+        at(23, 30, DAY - datetime.timedelta(days=1))
+    ]
+
+
+def test_recurring_starts_at_note_time_or_day_start():
+    trigger = RecurringTrigger(datetime.timedelta(hours=6))
+    assert list(trigger.fire_times(at(13), DAY)) == [at(13), at(19)]
+    assert list(trigger.fire_times(None, DAY)) == [at(8), at(14), at(20)]
+
+
+def test_index_fires_each_note_once_per_minute():
+    index = ReminderIndex()
+    notes = [
+        make_note("a", ["t09:00", "-60m"], at(10)),
+        make_note("b", ["t09:00"]),
+        make_note("c", ["t07:00", "t11:00"]),
+    ]
+    index.rebuild(notes, at(8))
+    # t07:00 уже прошло, повторы a в 09:00 схлопываются
+    assert index.next_fire_time() == at(9)
+    assert len(index) == 2
+    due = index.pop_due(at(9, 0))
+    assert [(fire_time, note.id) for fire_time, note in due] == [
+        (at(9), "a"),
+        (at(9), "b"),
+    ]
+    assert index.pop_due(at(10, 30)) == []
+    assert [note.id for _, note in index.pop_due(at(11))] == ["c"]
+    assert index.next_fire_time() is None
+
+
+def test_index_rebuild_does_not_refire():
+    index = ReminderIndex()
+    notes = [make_note("a", ["t09:00", "t12:00"])]
+    index.rebuild(notes, at(8))
+    assert len(index.pop_due(at(9, 0, DAY).replace(second=30))) == 1
+    index.rebuild(notes, at(9).replace(second=45))
+    assert index.next_fire_time() == at(12)
+
+
+def test_index_picks_up_edited_flags():
+    index = ReminderIndex()
+    index.rebuild([make_note("a", ["t09:00"])], at(8))
+    edited = make_note("a", ["t10:00"], edited="2026-03-10T07:30:00.000Z")
+    index.rebuild([edited], at(8))
+    assert index.next_fire_time() == at(10)
+
+
+def test_index_picks_up_flags_edited_in_same_minute():
+    index = ReminderIndex()
+    index.rebuild([make_note("a", ["t10:00"])], at(8))
+    index.rebuild([make_note("a", ["t11:00"])], at(8))
+    assert index.next_fire_time() == at(11)
+
+
+def test_index_skips_notes_without_id():
+    note = make_note("a", ["t09:00"])
+    note.id = None
+    index = ReminderIndex()
+    index.rebuild([note], at(8))
+    assert index.next_fire_time() is None
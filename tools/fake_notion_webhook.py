@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import uuid
+import aiohttp
+
+
+async def send_event(url: str, event: dict, token: str | None) -> int:
+    body = json.dumps(event).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if token is not None:
+        digest = hmac.new(token.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Notion-Signature"] = "sha256=%s" % digest
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, data=body, headers=headers) as resp:
+            return resp.status
+
+
+def make_event(event_type: str, page_id: str, database_id: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "type": event_type,
+        "attempt_number": 1,
+        "entity": {"id": page_id, "type": "page"},
+        "data": {"parent": {"id": database_id, "type": "database"}},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a fake Notion webhook event")
+    parser.add_argument("url")
+    parser.add_argument("page_id")
+    parser.add_argument("--db-id", required=True)
+    parser.add_argument("--type", default="page.properties_updated")
+    parser.add_argument("--token", default=None)
+    args = parser.parse_args()
+    status = asyncio.run(
+        send_event(
+            args.url, make_event(args.type, args.page_id, args.db_id), args.token
+        )
+    )
+    print("HTTP %d" % status)